@@ -1,14 +1,17 @@
 import time
 import json
+from typing import Literal, Optional
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import asyncio
 from src.agent import CdpAgent, CdpAgentClassifier
 from src.wallet import AgentWallet
+from src.actions import ActionTracker
+from src.admission import AdmissionRejected
 from models.schemas import *
 load_dotenv()
 
@@ -31,12 +34,28 @@ URL_KNOWLEDGE = "https://opti-backend.vercel.app/staking"
 cdp_agent_classifier = CdpAgentClassifier()
 cdp_agent = CdpAgent(url=URL_KNOWLEDGE)
 agent_wallet = AgentWallet()
+action_tracker = ActionTracker()
+
+# Admission priority per endpoint, lower is served first; streaming clients
+# see progress as soon as they are admitted
+PRIORITIES = {"query/stream": 0, "query": 1}
+
+
+def rejected(e: AdmissionRejected):
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize agent when the API starts."""
     await cdp_agent_classifier.initialize()
     await cdp_agent.initialize()
+    cdp_agent.start_background_refresh()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await cdp_agent.stop_background_refresh()
 
 
 @app.post("/generate-risk-profile")
@@ -50,6 +69,8 @@ async def assess_risk(request: QueryRequestClassifier):
         parsed_response = json.loads(response)
         
         return JSONResponse(content=parsed_response)
+    except AdmissionRejected as e:
+        raise rejected(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -62,36 +83,115 @@ async def query_agent_sync(request: QueryRequest):
     try:
         start_time = time.time()
         
-        response = await asyncio.wait_for(
-            cdp_agent.process_query(query=request.query, thread_id=request.thread_id
+        response, cache = await asyncio.wait_for(
+            cdp_agent.answer(query=request.query, thread_id=request.thread_id, priority=PRIORITIES["query"]
             ), timeout=30.0)
 
-        parsed_response = json.loads(response) if isinstance(response, str) else response
-        formatted_response = {
-            "id_project": str(parsed_response.get("id_project", ""))
-        }
-        processing_time = time.time() - start_time
-
-        response_json = {
-            "response": [formatted_response],
-            "thread_id": request.thread_id or "CDP Agent API",
-            "processing_time": processing_time
-        }
-
-        return JSONResponse(content=response_json)
+        return JSONResponse(content=query_payload(response, request.thread_id, start_time, cache))
         
+    except AdmissionRejected as e:
+        raise rejected(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Query processing failed: {str(e)}"
         )
+
+
+def query_payload(response, thread_id, start_time, cache=None):
+    parsed_response = json.loads(response) if isinstance(response, str) else response
+    formatted_response = {
+        "id_project": str(parsed_response.get("id_project", ""))
+    }
+    processing_time = time.time() - start_time
+
+    return {
+        "response": [formatted_response],
+        "thread_id": thread_id or "CDP Agent API",
+        "processing_time": processing_time,
+        "cache": cache
+    }
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+async def query_agent_stream(request: QueryRequest):
+    """
+    Streaming variant of /query over Server-Sent Events. Emits agent steps
+    (tool_call, tool_result) and answer tokens as they are produced, then a
+    "result" event with the same payload /query returns, or an "error" event.
+    """
+    start_time = time.time()
+    deadline = start_time + 30.0
+
+    # Shed load here, while a 429 can still be sent instead of an SSE error event
+    try:
+        cdp_agent.admission.check()
+    except AdmissionRejected as e:
+        raise rejected(e)
+
+    async def events():
+        stream = cdp_agent.stream_query(query=request.query, thread_id=request.thread_id, priority=PRIORITIES["query/stream"])
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(anext(stream), timeout=max(deadline - time.time(), 0))
+                except StopAsyncIteration:
+                    yield sse("error", {"detail": "Agent finished without an answer"})
+                    return
+                except asyncio.TimeoutError:
+                    yield sse("error", {"detail": "Query processing timed out"})
+                    return
+                except Exception as e:
+                    yield sse("error", {"detail": f"Query processing failed: {str(e)}"})
+                    return
+
+                if event == "final":
+                    try:
+                        yield sse("result", query_payload(data["content"], request.thread_id, start_time, data.get("cache")))
+                    except Exception as e:
+                        yield sse("error", {"detail": f"Query processing failed: {str(e)}"})
+                    return
+                yield sse(event, data)
+                if event == "error":
+                    return
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/yields")
+async def yields(
+    chain: Optional[str] = None,
+    token: Optional[str] = None,
+    stablecoin: Optional[bool] = None,
+    min_apy: Optional[float] = None,
+    min_tvl: Optional[float] = None,
+    sort_by: Literal["apy", "tvl"] = "apy",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(10, ge=0)
+):
+    """
+    Exact filter and top-k over the current staking feed, e.g.
+    /yields?chain=base&stablecoin=true&sort_by=apy&limit=1
+    """
+    snapshot = cdp_agent.snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Knowledge base not loaded yet")
+    try:
+        rows = snapshot.table.query(chain, token, stablecoin, min_apy, min_tvl, sort_by, order == "desc", limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"version": snapshot.version, "count": len(rows), "rows": rows}
+
         
 @app.post("/action/create-wallet")
 async def create_wallet(request: QueryUserWallet):
-    await agent_wallet.create_wallet(
-            user_address=request.user_address
-        )
-    txhash = await agent_wallet._fund_wallet(request.user_address)
+    txhash = await agent_wallet.onboard(request.user_address)
     response = {"address": await agent_wallet._check_address(request.user_address)}
     
     return JSONResponse(content=response)
@@ -109,33 +209,119 @@ async def get_eth_faucet(request: QueryUserWallet):
     return JSONResponse(content=response)
 
 
+async def run_action(action, user_address, wait, start):
+    """
+    Await the action and return its txhash, or with wait=false return an
+    action id right away for polling on /action/status/{id}.
+    """
+    if wait:
+        return JSONResponse(content={"txhash": await start(None)})
+
+    record = action_tracker.submit(action, user_address, start)
+    return JSONResponse(content={"id": record["id"], "status": record["status"]}, status_code=202)
+
+
 @app.post("/action/mint")
 async def mint(request: QueryMint):
-    response = {"txhash": await agent_wallet.mint(request.user_address, request.asset_id, request.amount)}
-    return JSONResponse(content=response)
+    return await run_action("mint", request.user_address, request.wait, lambda on_submitted: agent_wallet.mint(
+        request.user_address, request.asset_id, request.amount, on_submitted=on_submitted))
 
 
 @app.post("/action/transfer")
 async def transfer(request: QueryTransfer):
-    response = {"txhash": await agent_wallet.transfer(request.user_address, request.contract_address, request.to, request.amount)}
-    return JSONResponse(content=response)
+    return await run_action("transfer", request.user_address, request.wait, lambda on_submitted: agent_wallet.transfer(
+        request.user_address, request.contract_address, request.to, request.amount, on_submitted=on_submitted))
 
 
 @app.post("/action/swap")
 async def swap(request: QuerySwap):
-    response = {"txhash": await agent_wallet.swap(request.user_address, request.spender, request.token_in, request.token_out, request.amount)}
-    return JSONResponse(content=response)
+    return await run_action("swap", request.user_address, request.wait, lambda on_submitted: agent_wallet.swap(
+        request.user_address, request.spender, request.token_in, request.token_out, request.amount, on_submitted=on_submitted))
 
 
 @app.post("/action/stake")
 async def stake(request: QueryStake):
-    response = {"txhash": await agent_wallet.stake(request.user_address, request.asset_id, request.protocol, request.spender, request.amount)}
-    return JSONResponse(content=response)
+    return await run_action("stake", request.user_address, request.wait, lambda on_submitted: agent_wallet.stake(
+        request.user_address, request.asset_id, request.protocol, request.spender, request.amount, on_submitted=on_submitted))
 
 @app.post("/action/unstake")
 async def unstake(request: QueryUnstake):
-    response = {"txhash": await agent_wallet.unstake(request.user_address, request.protocol)}
-    return JSONResponse(content=response)
+    return await run_action("unstake", request.user_address, request.wait, lambda on_submitted: agent_wallet.unstake(
+        request.user_address, request.protocol, on_submitted=on_submitted))
+
+
+def start_operation(op, on_submitted):
+    if op.type == "create_wallet":
+        return agent_wallet.onboard(op.user_address)
+    if op.type == "faucet":
+        return agent_wallet._fund_wallet(op.user_address)
+    if op.type == "mint":
+        return agent_wallet.mint(op.user_address, op.asset_id, op.amount, on_submitted=on_submitted)
+    if op.type == "transfer":
+        return agent_wallet.transfer(op.user_address, op.contract_address, op.to, op.amount, on_submitted=on_submitted)
+    if op.type == "swap":
+        return agent_wallet.swap(op.user_address, op.spender, op.token_in, op.token_out, op.amount, on_submitted=on_submitted)
+    if op.type == "stake":
+        return agent_wallet.stake(op.user_address, op.asset_id, op.protocol, op.spender, op.amount, on_submitted=on_submitted)
+    return agent_wallet.unstake(op.user_address, op.protocol, on_submitted=on_submitted)
+
+
+@app.post("/action/batch")
+async def batch(request: QueryBatch):
+    """
+    Run many operations at once. Operations on the same wallet run in the
+    order given, different wallets run concurrently. Returns a batch id for
+    /action/status/{id}, the full result with wait=true, or one JSON line per
+    item as it finishes with stream=true.
+    """
+    record = action_tracker.submit_batch([
+        (op.type, op.user_address, lambda on_submitted, op=op: start_operation(op, on_submitted))
+        for op in request.operations
+    ])
+
+    if request.stream:
+        async def lines():
+            async for item in action_tracker.iter_batch(record["id"]):
+                yield json.dumps(item) + "\n"
+            yield json.dumps({key: value for key, value in record.items() if key != "items"}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    if request.wait:
+        return JSONResponse(content=await action_tracker.wait(record["id"], None))
+
+    return JSONResponse(content={"id": record["id"], "status": record["status"], "total": record["total"]}, status_code=202)
+
+
+@app.get("/action/status/{action_id}")
+async def action_status(action_id: str, timeout: float = 0.0):
+    """
+    Status of an action submitted with wait=false. With timeout > 0 the
+    request long-polls until the action finishes or the timeout expires.
+    """
+    record = await action_tracker.wait(action_id, min(timeout, 60.0))
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown action id: {action_id}")
+    return JSONResponse(content=record)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Cache and queue counters
+    """
+    return {
+        "wallet_cache": agent_wallet.wallet_cache.stats(),
+        "embedding_cache": cdp_agent.embeddings.stats(),
+        "coalescing": cdp_agent.coalescing_stats(),
+        "answer_cache": cdp_agent.answers.stats(),
+        "agent_usage": cdp_agent.usage.stats(),
+        "agent_admission": cdp_agent.admission.stats(),
+        "classifier": cdp_agent_classifier.stats(),
+        "actions": action_tracker.stats(),
+        "allowances": agent_wallet.allowances.stats(),
+        "receipts": agent_wallet.receipts.stats(),
+        "wallet_executor": agent_wallet.executor.stats()
+    }
 
 
 @app.get("/health")
@@ -143,12 +329,13 @@ async def health_check():
     """
     Health check endpoint
     """
+    agent = cdp_agent.admission.stats()
+    classifier = cdp_agent_classifier.admission.stats()
+    saturated = any(stats["queued"] >= stats["max_queue"] for stats in (agent, classifier))
     return {
-        "status": "healthy",
-        "thread_pool_info": {
-            "max_workers": cdp_agent.thread_pool._max_workers,
-            "active_threads": cdp_agent.thread_pool._work_queue.qsize()
-        }
+        "status": "busy" if saturated else "healthy",
+        "agent": {key: agent[key] for key in ("slots", "busy", "queued", "max_queue")},
+        "classifier": {key: classifier[key] for key in ("slots", "busy", "queued", "max_queue")}
     }
     
 
@@ -1,5 +1,5 @@
-from typing import Optional
-from pydantic import BaseModel
+from typing import Annotated, List, Literal, Optional, Union
+from pydantic import BaseModel, Field
 
 class QueryRequestClassifier(BaseModel):
     data: str
@@ -17,31 +17,77 @@ class QueryResponse(BaseModel):
 class QueryUserWallet(BaseModel):
     user_address: str
     
-class QueryMint(BaseModel):
+class MintOperation(BaseModel):
     user_address: str
     asset_id: str
     amount: str
     
-class QueryTransfer(BaseModel):
+class QueryMint(MintOperation):
+    wait: bool = True
+    
+class TransferOperation(BaseModel):
     user_address: str
     contract_address: str
     to: str
     amount: str
     
-class QuerySwap(BaseModel):
+class QueryTransfer(TransferOperation):
+    wait: bool = True
+    
+class SwapOperation(BaseModel):
     user_address: str
     spender: str
     token_in: str
     token_out: str
     amount: str
     
-class QueryStake(BaseModel):
+class QuerySwap(SwapOperation):
+    wait: bool = True
+    
+class StakeOperation(BaseModel):
     user_address: str
     asset_id: str
     protocol: str
     spender: str
     amount: str
     
-class QueryUnstake(BaseModel):
+class QueryStake(StakeOperation):
+    wait: bool = True
+    
+class UnstakeOperation(BaseModel):
     user_address: str
-    protocol: str
\ No newline at end of file
+    protocol: str
+    
+class QueryUnstake(UnstakeOperation):
+    wait: bool = True
+    
+class BatchCreateWallet(QueryUserWallet):
+    type: Literal["create_wallet"]
+    
+class BatchFaucet(QueryUserWallet):
+    type: Literal["faucet"]
+    
+class BatchMint(MintOperation):
+    type: Literal["mint"]
+    
+class BatchTransfer(TransferOperation):
+    type: Literal["transfer"]
+    
+class BatchSwap(SwapOperation):
+    type: Literal["swap"]
+    
+class BatchStake(StakeOperation):
+    type: Literal["stake"]
+    
+class BatchUnstake(UnstakeOperation):
+    type: Literal["unstake"]
+    
+BatchOperation = Annotated[
+    Union[BatchCreateWallet, BatchFaucet, BatchMint, BatchTransfer, BatchSwap, BatchStake, BatchUnstake],
+    Field(discriminator="type")
+]
+    
+class QueryBatch(BaseModel):
+    operations: List[BatchOperation]
+    wait: bool = False
+    stream: bool = False
\ No newline at end of file
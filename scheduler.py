@@ -1,13 +1,17 @@
+import os
 import schedule
 import time
+import logging
 from datetime import datetime
 import pytz
 from src.rules import runner
 
 utc = pytz.utc
 
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
 def task_periodicly():
-    runner()
+    runner(dry_run=os.getenv("REBALANCE_DRY_RUN", "false").lower() == "true")
 
 schedule.every().hour.at(":00").do(task_periodicly)
 
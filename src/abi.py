@@ -0,0 +1,71 @@
+import os
+import orjson
+from eth_abi.registry import registry
+from eth_abi.encoding import TupleEncoder
+from eth_abi.decoding import TupleDecoder, ContextFramesBytesIO
+from eth_utils import function_signature_to_4byte_selector
+
+ABI_DIR = "./abi"
+
+
+def _abi_type(param):
+    if not param["type"].startswith("tuple"):
+        return param["type"]
+    components = ",".join(_abi_type(component) for component in param["components"])
+    return f"({components}){param['type'][len('tuple'):]}"
+
+
+class AbiFunction:
+    """A contract method with its selector and argument/result codecs built once."""
+
+    def __init__(self, entry):
+        self.name = entry["name"]
+        self.input_names = [param["name"] for param in entry["inputs"]]
+        self.input_types = [_abi_type(param) for param in entry["inputs"]]
+        self.output_types = [_abi_type(param) for param in entry.get("outputs", [])]
+        self.signature = f"{self.name}({','.join(self.input_types)})"
+        self.selector = function_signature_to_4byte_selector(self.signature)
+        self._encoder = TupleEncoder(encoders=tuple(registry.get_encoder(t) for t in self.input_types))
+        self._decoder = TupleDecoder(decoders=tuple(registry.get_decoder(t) for t in self.output_types))
+
+    def encode(self, *args) -> bytes:
+        return self.selector + self._encoder(args)
+
+    def encode_kwargs(self, **kwargs) -> bytes:
+        return self.encode(*(kwargs[name] for name in self.input_names))
+
+    def decode(self, data: bytes):
+        return self._decoder(ContextFramesBytesIO(bytes(data)))
+
+
+class AbiRegistry:
+    """Process-wide ABI registry: every ABI in `abi_dir` is parsed once at import time."""
+
+    def __init__(self, abi_dir: str = ABI_DIR):
+        self.abi_dir = abi_dir
+        self.abis = {}
+        self.functions = {}
+
+        for file_name in sorted(os.listdir(abi_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            name = file_name[:-len(".json")]
+            with open(os.path.join(abi_dir, file_name), 'rb') as file:
+                abi = orjson.loads(file.read())
+
+            self.abis[name] = abi
+            for entry in abi:
+                if entry["type"] == "function":
+                    self.functions[(name, entry["name"])] = AbiFunction(entry)
+
+    def get(self, name):
+        return self.abis[name]
+
+    def function(self, name, method) -> AbiFunction:
+        return self.functions[(name, method)]
+
+    def encode(self, name, method, *args) -> bytes:
+        return self.functions[(name, method)].encode(*args)
+
+
+abi_registry = AbiRegistry()
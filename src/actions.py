@@ -0,0 +1,173 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+
+class ActionTracker:
+    """
+    Runs wallet actions in the background and keeps a pollable record per
+    action: pending -> submitted (txhash known) -> confirmed | failed.
+    A batch is one record holding an item per operation.
+    Finished records are kept for `ttl` seconds, at most `max_records` of them.
+    """
+
+    def __init__(self, max_records: int = 10000, ttl: float = 3600.0):
+        self.max_records = max_records
+        self.ttl = ttl
+        self._records = {}
+        # Finished action ids, oldest finish first
+        self._finished = OrderedDict()
+        self._done = {}
+        self._item_done = {}
+        self._tasks = set()
+
+    def _new_record(self, action, user_address, **extra):
+        self._prune()
+
+        action_id = uuid.uuid4().hex
+        record = {
+            "id": action_id,
+            "action": action,
+            "user_address": user_address,
+            "status": "pending",
+            "txhash": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            **extra
+        }
+        self._records[action_id] = record
+        self._done[action_id] = asyncio.Event()
+        return record
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _start(self, record, start, done):
+        """
+        `start(on_submitted)` must return the awaitable doing the work; it is
+        handed a callback to report the txhash once the transaction is broadcast.
+        """
+        loop = asyncio.get_running_loop()
+
+        def on_submitted(txhash):
+            loop.call_soon_threadsafe(self._mark_submitted, record, txhash)
+
+        return self._spawn(self._run(record, start(on_submitted), done))
+
+    def submit(self, action: str, user_address: str, start):
+        record = self._new_record(action, user_address)
+        self._start(record, start, self._done[record["id"]])
+        return record
+
+    def submit_batch(self, operations):
+        """
+        Start every (action, user_address, start) in `operations` at once.
+        They are handed to the wallet executor in list order, so operations on
+        the same wallet keep that order while different wallets run in parallel.
+        """
+        batch = self._new_record("batch", None, total=len(operations), completed=0, failed=0, items=[])
+        batch["status"] = "running"
+        events = []
+
+        tasks = []
+        for index, (action, user_address, start) in enumerate(operations):
+            item = {"index": index, "action": action, "user_address": user_address,
+                    "status": "pending", "txhash": None, "error": None}
+            batch["items"].append(item)
+            events.append(asyncio.Event())
+            tasks.append(self._start(item, start, events[-1]))
+        self._item_done[batch["id"]] = events
+
+        self._spawn(self._finish_batch(batch, tasks))
+        return batch
+
+    async def _finish_batch(self, batch, tasks):
+        await asyncio.gather(*tasks, return_exceptions=True)
+        batch["completed"] = sum(1 for item in batch["items"] if item["status"] == "confirmed")
+        batch["failed"] = sum(1 for item in batch["items"] if item["status"] == "failed")
+        batch["status"] = "done"
+        self._finish(batch)
+        self._done[batch["id"]].set()
+
+    def _mark_submitted(self, record, txhash):
+        if record["status"] == "pending":
+            record["status"] = "submitted"
+            record["txhash"] = txhash
+
+    async def _run(self, record, awaitable, done):
+        try:
+            record["txhash"] = await awaitable
+            record["status"] = "confirmed"
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+        finally:
+            # Batch items are tracked through their batch
+            if "finished_at" in record:
+                self._finish(record)
+            done.set()
+
+    def _finish(self, record):
+        record["finished_at"] = time.time()
+        self._finished[record["id"]] = None
+
+    def get(self, action_id):
+        return self._records.get(action_id)
+
+    async def wait(self, action_id, timeout: Optional[float]):
+        """
+        Long-poll: return the record once the action finishes or `timeout`
+        elapses (None waits until it finishes).
+        """
+        done = self._done.get(action_id)
+        if done is None:
+            return None
+        if timeout is None:
+            await done.wait()
+        elif timeout > 0:
+            try:
+                await asyncio.wait_for(done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._records.get(action_id)
+
+    async def iter_batch(self, batch_id):
+        """Yield the items of a batch in the order they finish."""
+        batch = self._records[batch_id]
+        waiters = {
+            asyncio.ensure_future(event.wait()): index
+            for index, event in enumerate(self._item_done[batch_id])
+        }
+        while waiters:
+            finished, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in finished:
+                yield batch["items"][waiters.pop(waiter)]
+
+    def _prune(self):
+        """
+        Evict finished records, oldest finish first, once expired or while over
+        `max_records`. Unfinished records are never evicted and do not hold
+        back finished ones.
+        """
+        now = time.time()
+        while self._finished:
+            action_id = next(iter(self._finished))
+            expired = now - self._records[action_id]["finished_at"] > self.ttl
+            if not expired and len(self._records) < self.max_records:
+                break
+            del self._finished[action_id]
+            del self._records[action_id]
+            del self._done[action_id]
+            self._item_done.pop(action_id, None)
+
+    def stats(self):
+        counts = {}
+        for record in self._records.values():
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+        return {"tracked": len(self._records), "by_status": counts}
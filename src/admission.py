@@ -0,0 +1,145 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class RunCancelled(Exception):
+    pass
+
+
+class CancellationCallback(BaseCallbackHandler):
+    """
+    Stops an agent run from inside its worker thread: once `event` is set,
+    the next chain, LLM, token or tool callback raises RunCancelled.
+    """
+
+    raise_error = True
+
+    def __init__(self, event):
+        self.event = event
+
+    def _check(self):
+        if self.event.is_set():
+            raise RunCancelled("Agent run cancelled")
+
+    def on_chain_start(self, *args, **kwargs):
+        self._check()
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self._check()
+
+    def on_llm_start(self, *args, **kwargs):
+        self._check()
+
+    def on_llm_new_token(self, *args, **kwargs):
+        self._check()
+
+    def on_tool_start(self, *args, **kwargs):
+        self._check()
+
+
+class AdmissionController:
+    """
+    Admits at most `slots` concurrent runs; the rest wait in a bounded
+    priority queue (lower number = served first, FIFO within a priority).
+
+    A request arriving to a full queue is rejected at once with 429, and one
+    that waits longer than `max_wait` seconds gets 503, so overload turns
+    into fast errors instead of requests timing out behind each other.
+    """
+
+    def __init__(self, slots: int, max_queue: int = 32, max_wait: float = 10.0):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._free = slots
+        self._queue = []
+        self._order = itertools.count()
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.max_depth = 0
+        self._waits = deque(maxlen=1000)
+
+    @property
+    def depth(self):
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def check(self):
+        """Fail fast with 429 if a new request could not even be queued right now."""
+        if self._free == 0 and self.depth >= self.max_queue:
+            self.rejected_full += 1
+            raise AdmissionRejected(429, "Server busy, try again shortly", retry_after=1)
+
+    async def acquire(self, priority: int = 0):
+        """Wait for a slot; the caller must call release() exactly once after."""
+        started = time.monotonic()
+        if self._free > 0 and not self.depth:
+            self._free -= 1
+            self._admit(started)
+            return
+
+        self.check()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._order), future))
+        self.max_depth = max(self.max_depth, self.depth)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait expired
+                self._admit(started)
+                return
+            future.cancel()
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, "Timed out waiting for a free agent slot", retry_after=int(self.max_wait))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+        self._admit(started)
+
+    def _admit(self, started):
+        self.admitted += 1
+        self._waits.append(time.monotonic() - started)
+
+    def release(self):
+        """Hand the slot to the next waiter, or return it to the pool. Loop thread only."""
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+    def stats(self):
+        waits = sorted(self._waits)
+        return {
+            "slots": self.slots,
+            "busy": self.slots - self._free,
+            "queued": self.depth,
+            "max_queue": self.max_queue,
+            "max_depth_seen": self.max_depth,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_time": {
+                "mean": sum(waits) / len(waits) if waits else None,
+                "p95": waits[min(int(0.95 * len(waits)), len(waits) - 1)] if waits else None,
+                "max": waits[-1] if waits else None
+            }
+        }
@@ -1,69 +1,195 @@
+import os
 import asyncio
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import aiohttp
-import pandas as pd
 import orjson
 from fastapi import HTTPException
 from langchain.chains import RetrievalQA
-from langchain.docstore.document import Document
-from langchain.tools import Tool
+from langchain.tools import StructuredTool, Tool
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_core.messages import HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 
 from cdp_langchain.agent_toolkits import CdpToolkit
 from cdp_langchain.utils import CdpAgentkitWrapper
 
+from src.admission import AdmissionController, CancellationCallback
+from src.answers import AnswerCache
+from src.batcher import MicroBatcher
+from src.cache import SqliteCache, TieredCache, TTLCache
+from src.embeddings import CachedEmbeddings, EMBEDDING_CACHE_DIR, normalize_query
+from src.knowledge import (
+    KNOWLEDGE_DIR,
+    KnowledgeSnapshot,
+    diff_rows,
+    feed_digest,
+    load_snapshot,
+    save_snapshot
+)
+from src.routing import route_query
+from src.singleflight import SingleFlight
+from src.usage import UsageCallback, UsageTracker
+from src.yields import YieldTable
+from src.risk import (
+    BATCH_CLASSIFIER_PROMPT,
+    RISK_LEVELS,
+    RISK_QUESTIONS,
+    RiskBatch,
+    RiskScorer,
+    answers_key,
+    batch_prompt,
+    parse_batch,
+    trim_history
+)
+from src.store import open_wallet_store
+
 
 
 
 class CdpAgent:
-    def __init__(self, url: str, max_workers: int = 3):
+    def __init__(self, url: str, max_workers: int = 3, refresh_interval: Optional[float] = None):
         self.url = url
         self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
-        self.agent_executor = None
+        self.refresh_interval = refresh_interval or float(os.getenv("KNOWLEDGE_REFRESH_INTERVAL", 300))
+        self.embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(),
+            cache_dir=os.getenv("EMBEDDING_CACHE_DIR", EMBEDDING_CACHE_DIR),
+            query_cache_size=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096)),
+            query_cache_ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 3600))
+        )
+        self.knowledge_dir = os.getenv("KNOWLEDGE_DIR", KNOWLEDGE_DIR)
+        self.snapshot: Optional[KnowledgeSnapshot] = None
         self._lock = asyncio.Lock()
-        self.knowledge_data = []
+        self._refresh_task = None
+        self._cdp_tools = None
+        self.query_flight = SingleFlight()
+        self.feed_flight = SingleFlight()
+        self.routing = os.getenv("AGENT_TOOL_ROUTING", "keywords")
+        self.usage = UsageTracker()
+        self.admission = AdmissionController(
+            slots=max_workers,
+            max_queue=int(os.getenv("AGENT_QUEUE_SIZE", 32)),
+            max_wait=float(os.getenv("AGENT_QUEUE_TIMEOUT", 10))
+        )
+        self.answers = AnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.96)),
+            maxsize=int(os.getenv("ANSWER_CACHE_SIZE", 2048))
+        )
     
     async def fetch_knowledge(self):
+        return await self.feed_flight.do(self.url, self._fetch_knowledge)
+
+    async def _fetch_knowledge(self):
         async with aiohttp.ClientSession() as session:
             async with session.get(self.url) as response:
                 if response.status == 200:
-                    self.knowledge_data = await response.json()
+                    return await response.json()
                 else:
                     raise HTTPException(status_code=response.status, detail=f"Failed to fetch {self.url}")
 
     async def initialize(self):
+        """Serve the snapshot persisted by the last run if there is one, else build it now."""
+        if self.snapshot is None:
+            async with self._lock:
+                self.snapshot = await asyncio.get_event_loop().run_in_executor(
+                    self.thread_pool,
+                    self._sync_load_snapshot
+                )
+        if self.snapshot is None:
+            await self.refresh()
+
+    async def refresh(self):
+        """Fetch the feed and swap in a new snapshot if it changed. Returns True on swap."""
         async with self._lock:
-            await self.fetch_knowledge()
-            retriever = await self.create_retriever()
-            self.agent_executor = await asyncio.get_event_loop().run_in_executor(
+            rows = await self.fetch_knowledge()
+            digest = feed_digest(rows)
+            if self.snapshot is not None and self.snapshot.digest == digest:
+                return False
+
+            snapshot = await asyncio.get_event_loop().run_in_executor(
                 self.thread_pool,
-                self._sync_initialize_agent,
-                retriever
+                self._sync_build_snapshot,
+                rows,
+                digest
             )
+            self.snapshot = snapshot
+            self.answers.invalidate()
 
-    async def create_retriever(self):
-        df = pd.DataFrame(self.knowledge_data)
-        docs = [
-            Document(
-                page_content=f"IdProject: {row['idProtocol']}, Chain: {row['chain']}, Symbol: {row['nameToken']}, TVL: {row['tvl']}, APY: {row['apy']}, Stablecoin: {row['stablecoin']}",
-                metadata={"symbol": row["nameToken"], "protocol": row["idProtocol"]}
-            )
-            for _, row in df.iterrows()
-        ]
+            try:
+                await asyncio.get_event_loop().run_in_executor(
+                    self.thread_pool,
+                    save_snapshot,
+                    snapshot,
+                    self.knowledge_dir
+                )
+            except Exception as e:
+                print(f"Failed to persist knowledge snapshot {snapshot.version}: {e}")
+            return True
+
+    def start_background_refresh(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_background_refresh(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        # The first pass revalidates a snapshot that was loaded from disk
+        while True:
+            try:
+                if await self.refresh():
+                    print(f"Knowledge snapshot refreshed to version {self.snapshot.version}")
+            except Exception as e:
+                print(f"Knowledge refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
 
-        return await asyncio.get_event_loop().run_in_executor(
-            self.thread_pool,
-            lambda: FAISS.from_documents(docs, OpenAIEmbeddings()).as_retriever()
+    def _sync_load_snapshot(self):
+        try:
+            loaded = load_snapshot(self.knowledge_dir, self.embeddings)
+        except Exception as e:
+            print(f"Failed to load knowledge snapshot from {self.knowledge_dir}: {e}")
+            return None
+        if loaded is None:
+            return None
+
+        version, digest, rows, documents, vectorstore = loaded
+        table = YieldTable(rows)
+        agents, tool_tokens = self._sync_initialize_agent(vectorstore.as_retriever(), table)
+        print(f"Loaded knowledge snapshot {version} from {self.knowledge_dir}")
+        return KnowledgeSnapshot(version, digest, rows, documents, vectorstore, agents, table, tool_tokens)
+
+    def _sync_build_snapshot(self, rows, digest):
+        previous = self.snapshot
+        reused, changed = diff_rows(previous, rows)
+
+        documents = dict(reused)
+        if changed:
+            vectors = self.embeddings.embed_documents([text for text, _ in changed.values()])
+            for (protocol_id, (text, metadata)), vector in zip(changed.items(), vectors):
+                documents[protocol_id] = (text, metadata, vector)
+
+        vectorstore = FAISS.from_embeddings(
+            [(text, vector) for text, _, vector in documents.values()],
+            self.embeddings,
+            metadatas=[metadata for _, metadata, _ in documents.values()]
         )
+        table = YieldTable(rows)
+        agents, tool_tokens = self._sync_initialize_agent(vectorstore.as_retriever(), table)
+
+        version = previous.version + 1 if previous is not None else 1
+        print(f"Knowledge snapshot {version}: {len(changed)} embedded, {len(reused)} reused")
+        return KnowledgeSnapshot(version, digest, rows, documents, vectorstore, agents, table, tool_tokens)
 
-    def _sync_initialize_agent(self, retriever):
-        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18")
+    def _sync_initialize_agent(self, retriever, table):
+        # stream_usage so streamed runs report token counts as well
+        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18", stream_usage=True)
         qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
         qa_tool = Tool(
             name="KnowledgeBaseQA",
@@ -71,34 +197,289 @@ class CdpAgent:
             description="Use this to search for TVL, APY, or DeFi information.",
         )
 
-        agentkit = CdpAgentkitWrapper()
-        cdp_toolkit = CdpToolkit.from_cdp_agentkit_wrapper(agentkit)
-        
-        tools = cdp_toolkit.get_tools()
-        tools.append(qa_tool)
+        def query_yields(
+            chain: Optional[str] = None,
+            token: Optional[str] = None,
+            stablecoin: Optional[bool] = None,
+            min_apy: Optional[float] = None,
+            min_tvl: Optional[float] = None,
+            sort_by: str = "apy",
+            descending: bool = True,
+            limit: int = 5
+        ) -> str:
+            rows = table.query(chain, token, stablecoin, min_apy, min_tvl, sort_by, descending, limit)
+            return orjson.dumps(rows).decode()
+
+        yield_tool = StructuredTool.from_function(
+            func=query_yields,
+            name="YieldTable",
+            description=(
+                "Exact filter and ranking over every staking pool in the knowledge base. "
+                "Use this for questions like highest APY, largest TVL or best stablecoin pool, optionally "
+                f"on one chain ({', '.join(table.chains())}) or token. sort_by is 'apy' or 'tvl'. "
+                "Returns matching pools as JSON including idProtocol."
+            )
+        )
+
+        if self._cdp_tools is None:
+            agentkit = CdpAgentkitWrapper()
+            cdp_toolkit = CdpToolkit.from_cdp_agentkit_wrapper(agentkit)
+            self._cdp_tools = cdp_toolkit.get_tools()
         
-        return create_react_agent(llm, tools=tools)
-
-    async def process_query(self, query: str, thread_id: Optional[str] = None):
-        await self.initialize()
-        config = {"configurable": {"thread_id": thread_id or "CDP Agent API"}}
-        return await asyncio.get_event_loop().run_in_executor(
-            self.thread_pool,
-            lambda: self.agent_executor.invoke(
-                {"messages": [HumanMessage(content=query)]},
-                config=config
-            )["messages"][-1].content
+        toolsets = {
+            "full": list(self._cdp_tools) + [yield_tool, qa_tool],
+            "knowledge": [yield_tool, qa_tool]
+        }
+
+        # Every agent step resends the bound tool schemas as prompt tokens
+        agents, tool_tokens = {}, {}
+        for route, tools in toolsets.items():
+            agents[route] = create_react_agent(llm, tools=tools)
+            tool_tokens[route] = llm.get_num_tokens(
+                orjson.dumps([convert_to_openai_tool(tool) for tool in tools]).decode()
+            )
+        return agents, tool_tokens
+
+    async def process_query(self, query: str, thread_id: Optional[str] = None, priority: int = 0):
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Agent not initialized. Please call initialize() first.")
+
+        route = route_query(query, self.routing)
+        usage = UsageCallback()
+        cancel = threading.Event()
+        config = {
+            "configurable": {"thread_id": thread_id or "CDP Agent API"},
+            "callbacks": [usage, CancellationCallback(cancel)]
+        }
+        loop = asyncio.get_running_loop()
+
+        def run():
+            try:
+                return snapshot.agents[route].invoke(
+                    {"messages": [HumanMessage(content=query)]},
+                    config=config
+                )["messages"][-1].content
+            finally:
+                self._record_usage(snapshot, route, usage)
+                loop.call_soon_threadsafe(self.admission.release)
+
+        async def work():
+            await self.admission.acquire(priority)
+            # Shielded so run() always executes and gives the slot back
+            running = loop.run_in_executor(self.thread_pool, run)
+            try:
+                return await asyncio.shield(running)
+            except asyncio.CancelledError:
+                # Nobody is waiting any more: stop the run at its next step
+                cancel.set()
+                running.add_done_callback(lambda done: done.exception())
+                raise
+
+        # Identical questions asked at the same time against the same knowledge run once
+        return await self.query_flight.do((normalize_query(query), snapshot.version), work)
+
+    def _record_usage(self, snapshot, route, usage):
+        self.usage.record(
+            route,
+            usage,
+            snapshot.tool_tokens.get(route, 0),
+            snapshot.tool_tokens.get("full", 0)
         )
 
+    async def answer(self, query: str, thread_id: Optional[str] = None, priority: int = 0):
+        """
+        process_query behind the semantic answer cache: a question close enough
+        to one already answered on the current snapshot, and naming the same
+        chains, tokens and ranking, gets that answer.
+        Returns (response, "hit" | "miss").
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Agent not initialized. Please call initialize() first.")
+
+        filters = snapshot.query_filters.extract(query)
+        vector = await self._lookup_vector(query)
+        if vector is not None:
+            cached = self.answers.lookup(snapshot.version, vector, filters)
+            if cached is not None:
+                return cached[0], "hit"
 
+        response = await self.process_query(query, thread_id, priority)
+        self._remember_answer(snapshot.version, vector, query, response, filters)
+        return response, "miss"
+
+    async def _lookup_vector(self, query):
+        try:
+            # Default executor: a lookup should not queue behind agent runs
+            return await asyncio.get_event_loop().run_in_executor(
+                None,
+                self.embeddings.embed_query,
+                query
+            )
+        except Exception as e:
+            print(f"Answer cache lookup skipped: {e}")
+            return None
+
+    def _remember_answer(self, version, vector, query, response, filters):
+        # Only answers the endpoints can turn into an id_project are worth replaying
+        if vector is None:
+            return
+        try:
+            if orjson.loads(response).get("id_project") is None:
+                return
+        except (orjson.JSONDecodeError, AttributeError):
+            return
+        self.answers.add(version, vector, query, response, filters)
+
+    def coalescing_stats(self):
+        return {"query": self.query_flight.stats(), "feed": self.feed_flight.stats()}
+
+    async def stream_query(self, query: str, thread_id: Optional[str] = None, priority: int = 0):
+        """
+        Run the agent like process_query, yielding (event, data) pairs as it goes:
+        "token" for final-answer text, "tool_call" and "tool_result" for each
+        tool step, then "final" with the full answer or "error". A semantic
+        cache hit yields only "final".
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise RuntimeError("Agent not initialized. Please call initialize() first.")
+
+        filters = snapshot.query_filters.extract(query)
+        vector = await self._lookup_vector(query)
+        if vector is not None:
+            cached = self.answers.lookup(snapshot.version, vector, filters)
+            if cached is not None:
+                yield "final", {"content": cached[0], "cache": "hit"}
+                return
+
+        route = route_query(query, self.routing)
+        usage = UsageCallback()
+        stop = threading.Event()
+        config = {
+            "configurable": {"thread_id": thread_id or "CDP Agent API"},
+            "callbacks": [usage, CancellationCallback(stop)]
+        }
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+
+        def emit(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def produce():
+            try:
+                for mode, chunk in snapshot.agents[route].stream(
+                    {"messages": [HumanMessage(content=query)]},
+                    config=config,
+                    stream_mode=["messages", "updates"]
+                ):
+                    # The client went away; stop spending tokens on it
+                    if stop.is_set():
+                        return
+                    for event in self._stream_events(mode, chunk):
+                        emit(event)
+            except Exception as e:
+                emit(("error", {"detail": str(e)}))
+            finally:
+                self._record_usage(snapshot, route, usage)
+                loop.call_soon_threadsafe(self.admission.release)
+                emit(finished)
+
+        await self.admission.acquire(priority)
+        loop.run_in_executor(self.thread_pool, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    return
+                event, data = item
+                if event == "final":
+                    self._remember_answer(snapshot.version, vector, query, data["content"], filters)
+                    data["cache"] = "miss"
+                yield event, data
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _stream_events(mode, chunk):
+        if mode == "messages":
+            message, metadata = chunk
+            # Only the agent's own tokens; tools may call an LLM internally too
+            if metadata.get("langgraph_node") == "agent" and isinstance(message.content, str) and message.content:
+                yield "token", {"content": message.content}
+            return
+
+        for node, update in chunk.items():
+            for message in (update or {}).get("messages", []):
+                if node == "agent" and isinstance(message, AIMessage):
+                    for call in message.tool_calls:
+                        yield "tool_call", {"name": call["name"], "args": call["args"]}
+                    if not message.tool_calls:
+                        yield "final", {"content": message.content}
+                elif node == "tools":
+                    yield "tool_result", {"name": getattr(message, "name", None), "content": str(message.content)[:1000]}
 
 
 class CdpAgentClassifier:
-    def __init__(self, max_workers: int = 3):
+    def __init__(self, max_workers: int = 3, batch_size: Optional[int] = None, batch_wait: Optional[float] = None, llm=None):
         self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
         self.agent_executor = None
+        self.llm = llm
+        self.batch_llm = None
         self._lock = asyncio.Lock()
-        self.file_path = "./data/wallet.json"
+        self.store = open_wallet_store()
+
+        cache_path = os.getenv("CLASSIFIER_CACHE_PATH")
+        self.cache = TieredCache(
+            TTLCache(
+                maxsize=int(os.getenv("CLASSIFIER_CACHE_SIZE", 4096)),
+                ttl=float(os.getenv("CLASSIFIER_CACHE_TTL", 86400))
+            ),
+            SqliteCache(cache_path, ttl=float(os.getenv("CLASSIFIER_CACHE_TTL", 86400)), table="classifier") if cache_path else None
+        )
+
+        # "stateless" sends each questionnaire on its own; "user" keeps a short,
+        # token-trimmed history per user that expires when the user goes idle
+        self.memory_mode = os.getenv("CLASSIFIER_MEMORY", "stateless")
+        self.history_tokens = int(os.getenv("CLASSIFIER_HISTORY_TOKENS", 1000))
+        self.threads = None
+        if self.memory_mode == "user":
+            threads_path = os.getenv("CLASSIFIER_THREADS_PATH")
+            threads_ttl = float(os.getenv("CLASSIFIER_THREAD_TTL", 3600))
+            self.threads = TieredCache(
+                TTLCache(maxsize=int(os.getenv("CLASSIFIER_MAX_THREADS", 1024)), ttl=threads_ttl),
+                SqliteCache(threads_path, ttl=threads_ttl, table="classifier_threads") if threads_path else None
+            )
+        elif self.memory_mode != "stateless":
+            raise ValueError(f"Unknown classifier memory mode: {self.memory_mode}")
+
+        # Answers the keyword scorer is confident about never reach the LLM
+        self.scorer = RiskScorer()
+        self.local_threshold = float(os.getenv("CLASSIFIER_LOCAL_THRESHOLD", 0.75))
+        self.sources = {"cache": 0, "local": 0, "llm": 0}
+
+        # Bounds single-request LLM runs; a micro-batch is one pool task however many it serves
+        self.admission = AdmissionController(
+            slots=max_workers,
+            max_queue=int(os.getenv("CLASSIFIER_QUEUE_SIZE", 64)),
+            max_wait=float(os.getenv("CLASSIFIER_QUEUE_TIMEOUT", 10))
+        )
+
+        # With a batch size above 1, concurrent cache misses share one LLM call.
+        # That call goes straight to the LLM: it takes no admission slot and
+        # sees no per-user history, so "user" memory mode only applies unbatched.
+        # A questionnaire the batch could not classify is retried on its own
+        batch_size = batch_size or int(os.getenv("CLASSIFIER_BATCH_SIZE", 1))
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = MicroBatcher(
+                self._sync_classify_batch,
+                max_batch_size=batch_size,
+                max_wait=batch_wait or float(os.getenv("CLASSIFIER_BATCH_WAIT", 0.05)),
+                executor=self.thread_pool
+            )
 
     async def initialize(self):
         async with self._lock:
@@ -109,24 +490,23 @@ class CdpAgentClassifier:
                 )
 
     def _sync_initialize_agent(self):
-        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18")
-        memory = MemorySaver()
-        
+        if self.llm is None:
+            self.llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18")
+        llm = self.llm
+        if self.batcher is not None:
+            self.batch_llm = llm.with_structured_output(RiskBatch)
+
+        # No checkpointer: history, when kept at all, is passed in explicitly
         return create_react_agent(
             llm,
             tools=[],
-            checkpointer=memory,
             state_modifier=(
                 "You are a risk profile classifier that evaluates users based on their responses to investment-related questions. "
                 "You MUST ALWAYS respond in valid JSON format with a single 'risk' key with value being either 'low', 'medium', or 'high'. "
                 "When analyzing responses, consider factors like: age, investment experience, financial goals, time horizon, and risk tolerance. "
                 "Base your classification on standard risk assessment principles. "
                 "Sample questions you should expect and factor into your analysis: "
-                "1. How do you feel about potential losses in staking investments? "
-                "2. How long are you willing to lock up your staked assets? "
-                "3. How do you assess smart contract security before staking? "
-                "4. What is your approach to diversification in staking? "
-                "5. How do you react to market fluctuations affecting your staked assets? "
+                + "".join(f"{index}. {question} " for index, question in enumerate(RISK_QUESTIONS, 1)) +
                 "Regardless of the input format, ALWAYS respond with: {\"risk\": \"risk_level\"} where risk_level is low, medium, or high"
             ),
         )
@@ -135,29 +515,96 @@ class CdpAgentClassifier:
         if self.agent_executor is None:
             raise RuntimeError("Agent not initialized. Please call initialize() first.")
             
-        config = {"configurable": {"thread_id": "Risk Assessment API"}}
-        
-        response =  await asyncio.get_event_loop().run_in_executor(
-            self.thread_pool,
-            lambda: self.agent_executor.invoke(
-                {"messages": [HumanMessage(content=query)]},
-                config=config
-            )["messages"][-1].content
-        )
-        
-        self._update_risk_profile(self._parse_risk(response), user_address)
-        
-        return response
-    
+        # Identical questionnaires get the same answer without another LLM round-trip
+        key = answers_key(query)
+        risk = self.cache.get(key)
+        if risk is not None:
+            return self._respond(risk, "cache", user_address)
+
+        risk, confidence, _ = self.scorer.score(query)
+        if confidence >= self.local_threshold:
+            return self._respond(risk, "local", user_address)
+
+        risk = None
+        if self.batcher is not None:
+            # Bypasses admission control and per-user history (see __init__)
+            try:
+                risk = await self.batcher.submit(query)
+            except Exception as e:
+                print(f"Batched classification failed, classifying alone: {e}")
+
+        if risk is None:
+            messages = self._history(user_address) + [{"role": "user", "content": query}]
+            messages = trim_history(messages, self.history_tokens)
+
+            response = await self._run_agent(messages)
+            self._remember(user_address, messages + [{"role": "assistant", "content": response}])
+            risk = self._parse_risk(response)
+
+        if risk in RISK_LEVELS:
+            self.cache.set(key, risk)
+        return self._respond(risk, "llm", user_address)
+
+    async def _run_agent(self, messages):
+        cancel = threading.Event()
+        loop = asyncio.get_running_loop()
+
+        def run():
+            try:
+                return self.agent_executor.invoke(
+                    {"messages": messages},
+                    config={"callbacks": [CancellationCallback(cancel)]}
+                )["messages"][-1].content
+            finally:
+                loop.call_soon_threadsafe(self.admission.release)
+
+        await self.admission.acquire()
+        # Shielded so run() always executes and gives the slot back
+        running = loop.run_in_executor(self.thread_pool, run)
+        try:
+            return await asyncio.shield(running)
+        except asyncio.CancelledError:
+            cancel.set()
+            running.add_done_callback(lambda done: done.exception())
+            raise
+
+    def _history(self, user_address):
+        if self.threads is None:
+            return []
+        return self.threads.get(user_address, [])
+
+    def _remember(self, user_address, messages):
+        if self.threads is not None:
+            self.threads.set(user_address, trim_history(messages, self.history_tokens))
+
+    def _respond(self, risk, source, user_address):
+        self.sources[source] += 1
+        self._update_risk_profile(risk, user_address)
+        return orjson.dumps({"risk": risk, "source": source}).decode()
+
+    def stats(self):
+        answered = sum(self.sources.values())
+        return {
+            "sources": dict(self.sources),
+            "local_threshold": self.local_threshold,
+            "llm_bypass_rate": (answered - self.sources["llm"]) / answered if answered else 0.0,
+            "local_hit_rate": self.sources["local"] / answered if answered else 0.0,
+            "cache": self.cache.stats(),
+            "threads": self.threads.stats() if self.threads else None,
+            "admission": self.admission.stats(),
+            "batches": self.batcher.stats() if self.batcher else None
+        }
+
+    def _sync_classify_batch(self, submissions):
+        """Classify several questionnaires in one structured-output LLM call."""
+        batch = self.batch_llm.invoke([
+            SystemMessage(content=BATCH_CLASSIFIER_PROMPT),
+            HumanMessage(content=batch_prompt(submissions))
+        ])
+        return parse_batch(batch, len(submissions))
+
     def _update_risk_profile(self, risk_profile: str, user_address: str):
-        with open(self.file_path, 'rb') as file:
-            wallet_data = orjson.loads(file.read())
-            
-        for entry in wallet_data:
-            if entry["user_address"] == user_address:
-                entry["risk_profile"] = risk_profile
-                with open(self.file_path, 'wb') as file:
-                    file.write(orjson.dumps(wallet_data, option=orjson.OPT_INDENT_2))
-                
+        self.store.set_risk_profile(user_address, risk_profile)
+
     def _parse_risk(self, response):
         return orjson.loads(response).get("risk")
\ No newline at end of file
@@ -0,0 +1,111 @@
+import threading
+from eth_account import Account
+from eth_utils import to_checksum_address
+
+
+class AllowanceCache:
+    """
+    Tracks ERC-20 allowances per (owner, token, spender) so an approve is only
+    sent when the current allowance does not cover the amount being spent.
+
+    Values are read from the chain on first use, then kept up to date from
+    confirmed approvals and spends. The cache only decides when an approve is
+    clearly needed; skipping one always costs a single `allowance()` call to
+    confirm it. With policy "standing" an approve grants at least
+    `standing_amount`, so later actions can skip it entirely.
+    """
+
+    def __init__(self, w3, abi_registry, approve_gas: int, policy: str = "exact", standing_amount: int = 0):
+        if policy not in ("exact", "standing"):
+            raise ValueError(f"Unknown approval policy: {policy}")
+
+        self.w3 = w3
+        self.approve_gas = approve_gas
+        self.policy = policy
+        self.standing_amount = standing_amount
+        self._allowance = abi_registry.function("MockToken", "allowance")
+        self._approve = abi_registry.function("MockToken", "approve")
+        self._values = {}
+        self._lock = threading.Lock()
+        self.approvals_sent = 0
+        self.approvals_skipped = 0
+
+    def _key(self, owner, token, spender):
+        return to_checksum_address(owner), to_checksum_address(token), to_checksum_address(spender)
+
+    def current(self, owner, token, spender, fresh=False):
+        key = self._key(owner, token, spender)
+        with self._lock:
+            value = self._values.get(key)
+        if value is None or fresh:
+            raw = self.w3.eth.call({"to": key[1], "data": self._allowance.encode(key[0], key[2])})
+            value = self._allowance.decode(raw)[0]
+            with self._lock:
+                self._values[key] = value
+        return value
+
+    def approval_for(self, owner, token, spender, amount):
+        """Amount to approve before spending `amount`, or None if no approve is needed."""
+        # A cached value that looks sufficient may be stale (another process can spend
+        # the same allowance), so confirm it on-chain before skipping the approve
+        key = self._key(owner, token, spender)
+        with self._lock:
+            cached = self._values.get(key)
+        if (cached is None or cached >= amount) and self.current(owner, token, spender, fresh=True) >= amount:
+            return None
+        if self.policy == "standing":
+            return max(amount + 10, self.standing_amount)
+        return amount + 10
+
+    def approved(self, owner, token, spender, amount):
+        with self._lock:
+            self._values[self._key(owner, token, spender)] = amount
+
+    def spent(self, owner, token, spender, amount):
+        key = self._key(owner, token, spender)
+        with self._lock:
+            if key in self._values:
+                self._values[key] = max(self._values[key] - amount, 0)
+
+    def invalidate(self, owner, token, spender):
+        with self._lock:
+            self._values.pop(self._key(owner, token, spender), None)
+
+    def approve_and_call(self, pipeline, private_key, token, spender, amount, call, on_submitted=None):
+        """
+        Send `call` (to, data, gas) through `pipeline`, preceded by an approve of
+        `token` for `spender` only when needed. Returns the call's tx hash.
+        """
+        owner = Account.from_key(private_key).address
+        approve_amount = self.approval_for(owner, token, spender, amount)
+
+        calls = [call]
+        if approve_amount is not None:
+            calls.insert(0, (token, self._approve.encode(to_checksum_address(spender), approve_amount), self.approve_gas))
+
+        try:
+            tx_hashes = pipeline.execute(private_key, calls, on_submitted)
+        except Exception:
+            # Whatever happened to the approve, read the allowance again next time
+            self.invalidate(owner, token, spender)
+            raise
+
+        with self._lock:
+            if approve_amount is None:
+                self.approvals_skipped += 1
+            else:
+                self.approvals_sent += 1
+        if approve_amount is not None:
+            self.approved(owner, token, spender, approve_amount)
+        self.spent(owner, token, spender, amount)
+        return tx_hashes[-1]
+
+    def stats(self):
+        decisions = self.approvals_sent + self.approvals_skipped
+        return {
+            "policy": self.policy,
+            "tracked": len(self._values),
+            "approvals_sent": self.approvals_sent,
+            "approvals_skipped": self.approvals_skipped,
+            "skip_rate": self.approvals_skipped / decisions if decisions else 0.0
+        }
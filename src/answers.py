@@ -0,0 +1,154 @@
+import re
+import threading
+import numpy as np
+
+# Words that flip which end of a ranking a question wants, and what it ranks by
+DIRECTION_WORDS = {
+    "highest": "max", "best": "max", "top": "max", "most": "max", "maximum": "max", "max": "max",
+    "largest": "max", "biggest": "max", "higher": "max", "greatest": "max",
+    "lowest": "min", "least": "min", "minimum": "min", "min": "min", "smallest": "min",
+    "worst": "min", "lower": "min", "safest": "min"
+}
+METRIC_WORDS = {
+    "apy": "apy", "apr": "apy", "yield": "apy", "yields": "apy", "return": "apy", "returns": "apy",
+    "tvl": "tvl", "liquidity": "tvl", "locked": "tvl"
+}
+STABLE_WORDS = ("stablecoin", "stablecoins", "stable")
+
+
+def _vocab_pattern(terms):
+    terms = sorted({term for term in terms if term}, key=len, reverse=True)
+    if not terms:
+        return None
+    return re.compile(r"(?<![a-z0-9])(" + "|".join(re.escape(term) for term in terms) + r")(?![a-z0-9])")
+
+
+class QueryFilters:
+    """
+    Parses the filters a /query question pins down: chains and tokens from
+    the feed's own vocabulary, ranking direction and metric words, and
+    whether it asks about stablecoins. Two questions only share an answer if
+    these match exactly, however close their embeddings are.
+    """
+
+    def __init__(self, chains=(), tokens=()):
+        self._chains = _vocab_pattern(chains)
+        self._tokens = _vocab_pattern(tokens)
+        self._words = _vocab_pattern(list(DIRECTION_WORDS) + list(METRIC_WORDS) + list(STABLE_WORDS))
+
+    @staticmethod
+    def _find(pattern, text):
+        return frozenset(pattern.findall(text)) if pattern is not None else frozenset()
+
+    def extract(self, query: str):
+        text = query.lower()
+        words = self._find(self._words, text)
+        return (
+            self._find(self._chains, text),
+            self._find(self._tokens, text),
+            frozenset(DIRECTION_WORDS[word] for word in words if word in DIRECTION_WORDS),
+            frozenset(METRIC_WORDS[word] for word in words if word in METRIC_WORDS),
+            any(word in STABLE_WORDS for word in words)
+        )
+
+
+class AnswerCache:
+    """
+    Answers to earlier /query questions for one knowledge version, looked up
+    by cosine similarity of the question embeddings. Only entries whose
+    parsed filters (see QueryFilters) equal the new question's can match.
+
+    Every entry belongs to the version it was answered against; a lookup or
+    insert for another version drops them all, so a feed change never serves
+    a stale answer. At most `maxsize` entries are kept, oldest dropped first.
+    """
+
+    def __init__(self, threshold: float = 0.96, maxsize: int = 2048):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.version = None
+        self._vectors = None
+        self._questions = []
+        self._filters = []
+        self._answers = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _stale(self, version):
+        return self.version is not None and version < self.version
+
+    def _switch(self, version):
+        if version != self.version:
+            if self._answers:
+                self.invalidations += 1
+            self.version = version
+            self._vectors = None
+            self._questions = []
+            self._filters = []
+            self._answers = []
+
+    def lookup(self, version, vector, filters=None):
+        """
+        Return (answer, question, similarity) of the closest match with the
+        same `filters` above the threshold, or None.
+        """
+        query = self._unit(vector)
+        with self._lock:
+            if self._stale(version):
+                self.misses += 1
+                return None
+            self._switch(version)
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors @ query
+            similarities[[entry != filters for entry in self._filters]] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._answers[best], self._questions[best], float(similarities[best])
+
+    def add(self, version, vector, question, answer, filters=None):
+        row = self._unit(vector)[None, :]
+        with self._lock:
+            # An answer computed against an older snapshot that finished late
+            if self._stale(version):
+                return
+            self._switch(version)
+            if self._vectors is None:
+                self._vectors = row
+            else:
+                self._vectors = np.concatenate([self._vectors[-(self.maxsize - 1):], row])
+                self._questions = self._questions[-(self.maxsize - 1):]
+                self._filters = self._filters[-(self.maxsize - 1):]
+                self._answers = self._answers[-(self.maxsize - 1):]
+            self._questions.append(question)
+            self._filters.append(filters)
+            self._answers.append(answer)
+
+    def invalidate(self):
+        with self._lock:
+            self._switch(None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": len(self._answers),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
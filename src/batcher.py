@@ -0,0 +1,76 @@
+import asyncio
+from typing import Optional
+
+
+class MicroBatcher:
+    """
+    Groups calls that arrive close together into one call of `handler`.
+
+    `submit(item)` waits until `max_batch_size` items are queued or `max_wait`
+    seconds have passed since the first one, then runs `handler(items)` in
+    `executor` and hands each caller its own entry of the returned list.
+    """
+
+    def __init__(self, handler, max_batch_size: int = 16, max_wait: float = 0.05, executor=None):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self._pending = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        self.batches += 1
+        self.items += len(items)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.handler, items)
+            if len(results) != len(items):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            self.failed_batches += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "queued": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "failed_batches": self.failed_batches,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,170 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+import orjson
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SqliteCache:
+    """
+    On-disk cache tier in SQLite. Values are stored as JSON and expire after
+    `ttl` seconds of wall-clock time, so they survive process restarts.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 86400.0, table: str = "cache"):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.table = table
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn.execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return orjson.loads(row[0])
+
+    def set(self, key, value):
+        self._conn.execute(
+            f"INSERT INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, orjson.dumps(value), time.time() + self.ttl)
+        )
+
+    def invalidate(self, key):
+        self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge(self):
+        """Delete expired rows; returns how many were removed."""
+        return self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.db_path,
+            "size": self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0],
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class TieredCache:
+    """A TTLCache in front of an optional SqliteCache; disk hits are promoted to memory."""
+
+    def __init__(self, memory: TTLCache, disk: Optional[SqliteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def invalidate(self, key):
+        self.memory.invalidate(key)
+        if self.disk is not None:
+            self.disk.invalidate(key)
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
@@ -1,7 +1,12 @@
-import orjson
+import os
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from web3 import Web3
 from cdp import Cdp, Wallet, WalletData
+from cache import TTLCache
+from multicall import BatchBalanceReader
+from store import open_wallet_store
 from utils import get_env_variable
 
 api_key = get_env_variable("CDP_API_KEY_NAME")
@@ -9,61 +14,125 @@ private_key = get_env_variable("CDP_API_KEY_PRIVATE_KEY")
 
 Cdp.configure(api_key, private_key)
 
-def _load_existing_data():
-    with open('data/wallet.json', 'rb') as file:
-        return orjson.loads(file.read())
+wallet_store = open_wallet_store()
+wallet_cache = TTLCache(
+    maxsize=int(os.getenv("WALLET_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("WALLET_CACHE_TTL", 600))
+)
+
+STAKING_URL = "https://opti-backend.vercel.app/staking"
+RPC_URL = os.getenv("RPC_URL", "https://api.developer.coinbase.com/rpc/v1/base-sepolia/vIyOU1PrjnUku5b1y2FGu416eItcu3KH")
+w3 = Web3(Web3.HTTPProvider(RPC_URL))
+balance_reader = BatchBalanceReader(
+    w3,
+    RPC_URL,
+    chunk_size=int(os.getenv("MULTICALL_CHUNK_SIZE", 500)),
+    mode=os.getenv("BALANCE_READER", "multicall")
+)
     
 def fetch_data(user_address):
-    existing_data = _load_existing_data()
+    wallet = wallet_cache.get(user_address)
+    if wallet is not None:
+        return wallet
 
-    for entry in existing_data:
-        if entry["user_address"] == user_address:
-            wallet_data_dict = entry["data"]
-            wallet_data = WalletData.from_dict(wallet_data_dict)
-            wallet = Wallet.import_wallet(wallet_data)
-            
-            return wallet        
+    entry = wallet_store.get(user_address)
+
+    if entry and entry.get("data"):
+        wallet_data = WalletData.from_dict(entry["data"])
+        wallet = Wallet.import_wallet(wallet_data)
+        wallet_cache.set(user_address, wallet)
+        
+        return wallet        
+
+def get_staking_protocols():
+    result = requests.get(STAKING_URL)
+    response = result.json()
+    return [item['addressStaking'] for item in response]
+
+def get_wallet_address(user_address):
+    """
+    On-chain address of the user's agent wallet, or None if it has none.
+    Read from the store; a wallet created before addresses were stored is
+    imported once and its address saved.
+    """
+    address = wallet_store.get_address(user_address)
+    if address:
+        return address
 
-def get_data_staked(user_address):
     wallet = fetch_data(user_address)
+    if wallet is None:
+        return None
     address = wallet.default_address.address_id
-    
-    rpc_url = "https://api.developer.coinbase.com/rpc/v1/base-sepolia/vIyOU1PrjnUku5b1y2FGu416eItcu3KH"
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    wallet_store.set_address(user_address, address)
+    return address
 
-    result = requests.get("https://opti-backend.vercel.app/staking")
-    response = result.json()
-    address_protocol = [item['addressStaking'] for item in response]
+def get_wallet_addresses(user_addresses, errors=None, max_workers=None):
+    """
+    Wallet addresses for many users, None where there is no wallet or the
+    lookup failed (the error goes into `errors`). Users whose address is not
+    stored yet are imported in parallel.
+    """
+    addresses = [wallet_store.get_address(user_address) for user_address in user_addresses]
+    missing = [i for i, address in enumerate(addresses) if not address]
+    if not missing:
+        return addresses
 
+    max_workers = max_workers or int(os.getenv("REBALANCE_CONCURRENCY", 8))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {i: pool.submit(get_wallet_address, user_addresses[i]) for i in missing}
+        for i, future in futures.items():
+            try:
+                addresses[i] = future.result()
+            except Exception as e:
+                if errors is not None:
+                    errors[user_addresses[i]] = str(e)
+    return addresses
 
-    with open("abi/MockStake.json", 'r') as file:
-        contract_abi = orjson.loads(file.read())
-    
-    result_amount = []
-    for i in range(len(address_protocol)):
-        contract_address = address_protocol[i]
-        contract = w3.eth.contract(address=contract_address, abi=contract_abi)
+def get_data_staked_many(user_addresses, address_protocol=None, errors=None):
+    """
+    Staked amounts of every user in every protocol as a users x protocols
+    matrix, read with batched calls. Users without a wallet get a NaN row;
+    if `errors` is given, users whose wallet or balances could not be read
+    are added to it with the reason.
+    """
+    if address_protocol is None:
+        address_protocol = get_staking_protocols()
+
+    addresses = get_wallet_addresses(user_addresses, errors)
+    present = [i for i, address in enumerate(addresses) if address]
+
+    balances = np.full((len(user_addresses), len(address_protocol)), np.nan)
+    if present and address_protocol:
         try:
-            w3.to_checksum_address(address)
-            balance = contract.functions.getAmountStakeByUser(address).call()
-            readable_balance = balance / (10 ** 6)
-            if int(readable_balance) > 0:
-                user_staked = {
-                    "protocol": contract_address,
-                    "amount": readable_balance, 
-                }
-                result_amount.append(user_staked)
-                
+            balances[present] = balance_reader.read([addresses[i] for i in present], address_protocol)
         except Exception as e:
-            print(f"Error retrieving balance: {e}")
+            print(f"Error reading balances: {e}")
+        if errors is not None:
+            for i in present:
+                if np.isnan(balances[i]).all():
+                    errors[user_addresses[i]] = "Balance read failed"
+    return address_protocol, balances
+
+def get_data_staked(user_address):
+    address_protocol, balances = get_data_staked_many([user_address])
+    
+    result_amount = []
+    for contract_address, readable_balance in zip(address_protocol, balances[0]):
+        if np.isnan(readable_balance):
+            print(f"Error retrieving balance: {contract_address}")
+            continue
+
+        if int(readable_balance) > 0:
+            user_staked = {
+                "protocol": contract_address,
+                "amount": float(readable_balance), 
+            }
+            result_amount.append(user_staked)
     
     return result_amount
 
 def get_risk(user_address):
-    wallet_data = _load_existing_data()
-    for entry in wallet_data:
-        if entry["user_address"] == user_address:
-            return entry["risk_profile"]
+    return wallet_store.get_risk_profile(user_address)
             
             
 if __name__ == "__main__":
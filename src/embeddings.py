@@ -0,0 +1,153 @@
+import os
+import re
+import hashlib
+import threading
+from typing import List
+import numpy as np
+import orjson
+from langchain_core.embeddings import Embeddings
+
+from src.cache import TTLCache
+
+EMBEDDING_CACHE_DIR = "./data/embeddings"
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, append-only vector store for one embedding model.
+
+    `vectors.f32` holds float32 rows and is read through a memory map,
+    `keys.txt` holds one content hash per row, `meta.json` the dimension.
+    """
+
+    def __init__(self, cache_dir: str, model: str):
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.keys_path = os.path.join(self.path, "keys.txt")
+        self.meta_path = os.path.join(self.path, "meta.json")
+
+        self.dim = None
+        self.index = {}
+        self._mmap = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+
+        with open(self.meta_path, 'rb') as file:
+            self.dim = orjson.loads(file.read())["dim"]
+        with open(self.keys_path, 'r') as file:
+            keys = file.read().split()
+
+        # A crash between the two appends leaves one file longer than the other
+        rows = min(len(keys), os.path.getsize(self.vectors_path) // (4 * self.dim))
+        if rows < len(keys) or os.path.getsize(self.vectors_path) != rows * 4 * self.dim:
+            with open(self.vectors_path, 'r+b') as file:
+                file.truncate(rows * 4 * self.dim)
+            with open(self.keys_path, 'w') as file:
+                file.write("".join(f"{key}\n" for key in keys[:rows]))
+        self.index = {key: row for row, key in enumerate(keys[:rows])}
+
+    def _vectors(self):
+        if self._mmap is None and self.index:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.index), self.dim))
+        return self._mmap
+
+    def get_many(self, keys):
+        with self._lock:
+            vectors = self._vectors()
+            return [vectors[self.index[key]] if key in self.index else None for key in keys]
+
+    def put_many(self, keys, vectors):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self.meta_path, 'wb') as file:
+                    file.write(orjson.dumps({"dim": self.dim}))
+
+            new_rows = [row for row, key in enumerate(keys) if key not in self.index]
+            if not new_rows:
+                return
+
+            with open(self.vectors_path, 'ab') as file:
+                file.write(matrix[new_rows].tobytes())
+            with open(self.keys_path, 'a') as file:
+                file.write("".join(f"{keys[row]}\n" for row in new_rows))
+
+            for row in new_rows:
+                self.index[keys[row]] = len(self.index)
+            self._mmap = None
+
+    def __len__(self):
+        return len(self.index)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Routes document embeddings through a persistent EmbeddingCache. Queries
+    are open-ended, so their embeddings only live in a bounded in-memory LRU.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_dir: str = EMBEDDING_CACHE_DIR,
+                 query_cache_size: int = 4096, query_cache_ttl: float = 3600.0):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.cache = EmbeddingCache(cache_dir, self.model)
+        self.query_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, prefix: str, text: str) -> str:
+        return f"{prefix}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("d", text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), embedded)
+            computed = dict(zip(missing.keys(), embedded))
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+
+        return [list(map(float, vector)) for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Normalized only for the key; the model sees the text as typed
+        key = self._key("q", normalize_query(text))
+        vector = self.query_cache.get(key)
+
+        if vector is None:
+            self.misses += 1
+            vector = list(map(float, self.embeddings.embed_query(text)))
+            self.query_cache.set(key, vector)
+        else:
+            self.hits += 1
+
+        return list(vector)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "size": len(self.cache),
+            "query_cache": self.query_cache.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class WalletExecutor:
+    """
+    Runs wallet operations through one ordered queue per wallet.
+
+    Operations for the same wallet run one at a time in submission order, so
+    they never race on its nonce or balances. Queues of different wallets are
+    drained in parallel on a pool of `max_workers` threads; a worker runs one
+    operation and then requeues its wallet behind the others, so a busy
+    wallet cannot starve the rest.
+    """
+
+    def __init__(self, max_workers: int = 16):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wallet")
+        self._queues = {}
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._waits = deque(maxlen=1000)
+
+    def submit(self, wallet_key, fn, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(wallet_key)
+            idle = queue is None
+            if idle:
+                queue = self._queues[wallet_key] = deque()
+            queue.append((fn, args, kwargs, future, time.monotonic()))
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(queue))
+
+        # A wallet already in _queues has a drain scheduled or running
+        if idle:
+            self._pool.submit(self._drain, wallet_key)
+        return future
+
+    def _drain(self, wallet_key):
+        with self._lock:
+            fn, args, kwargs, future, enqueued_at = self._queues[wallet_key][0]
+            self._waits.append(time.monotonic() - enqueued_at)
+
+        failed = False
+        if future.set_running_or_notify_cancel():
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                failed = True
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            queue = self._queues[wallet_key]
+            queue.popleft()
+            if not queue:
+                del self._queues[wallet_key]
+                return
+        self._pool.submit(self._drain, wallet_key)
+
+    def stats(self):
+        with self._lock:
+            depths = [len(queue) for queue in self._queues.values()]
+            waits = sorted(self._waits)
+
+        return {
+            "max_workers": self.max_workers,
+            "active_wallets": len(depths),
+            "queued": sum(depths),
+            "deepest_queue": max(depths, default=0),
+            "max_depth_seen": self.max_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_time": {
+                "mean": sum(waits) / len(waits) if waits else None,
+                "p95": waits[min(int(0.95 * len(waits)), len(waits) - 1)] if waits else None,
+                "max": waits[-1] if waits else None
+            }
+        }
+
+
+_default_executor = None
+_default_lock = threading.Lock()
+
+
+def get_wallet_executor() -> WalletExecutor:
+    """Process-wide executor shared by every wallet client."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = WalletExecutor(max_workers=int(os.getenv("WALLET_MAX_WORKERS", 16)))
+        return _default_executor
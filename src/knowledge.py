@@ -0,0 +1,123 @@
+import os
+import shutil
+import pickle
+import hashlib
+import faiss
+import orjson
+from langchain_community.vectorstores import FAISS
+
+from src.answers import QueryFilters
+from src.yields import YieldTable
+
+KNOWLEDGE_DIR = "./data/knowledge"
+
+
+def document_text(row):
+    return (
+        f"IdProject: {row['idProtocol']}, Chain: {row['chain']}, Symbol: {row['nameToken']}, "
+        f"TVL: {row['tvl']}, APY: {row['apy']}, Stablecoin: {row['stablecoin']}"
+    )
+
+
+def feed_digest(rows):
+    return hashlib.sha256(orjson.dumps(rows, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class KnowledgeSnapshot:
+    """
+    Immutable view of the staking feed at one point in time: the rows, their
+    columnar yield table, their embedded documents and the agent built on top
+    of them. Readers grab the
+    current snapshot once and never see a half-built one.
+    """
+
+    def __init__(self, version, digest, rows, documents, vectorstore, agents, table=None, tool_tokens=None):
+        self.version = version
+        self.digest = digest
+        self.rows = rows
+        self.table = table if table is not None else YieldTable(rows)
+        # Chain and token vocabulary the answer cache must match exactly
+        self.query_filters = QueryFilters(self.table.chains(), self.table.tokens())
+        # idProtocol -> (page_content, metadata, vector)
+        self.documents = documents
+        self.vectorstore = vectorstore
+        # route -> agent offered that route's tool subset, and its schema size in tokens
+        self.agents = agents
+        self.tool_tokens = tool_tokens or {}
+
+    @property
+    def agent_executor(self):
+        return self.agents["full"]
+
+
+def diff_rows(snapshot, rows):
+    """Split `rows` into documents reusable from `snapshot` and ones that need embedding."""
+    previous_documents = snapshot.documents if snapshot is not None else {}
+    reused, changed = {}, {}
+    for row in rows:
+        protocol_id = row["idProtocol"]
+        text = document_text(row)
+        previous = previous_documents.get(protocol_id)
+        if previous is not None and previous[0] == text:
+            reused[protocol_id] = previous
+        else:
+            changed[protocol_id] = (text, {"symbol": row["nameToken"], "protocol": protocol_id})
+    return reused, changed
+
+
+def save_snapshot(snapshot, knowledge_dir):
+    """Write the snapshot's index under `knowledge_dir/v<version>` and point `current.json` at it."""
+    os.makedirs(knowledge_dir, exist_ok=True)
+    folder = f"v{snapshot.version}"
+    snapshot.vectorstore.save_local(os.path.join(knowledge_dir, folder))
+    with open(os.path.join(knowledge_dir, folder, "rows.json"), 'wb') as file:
+        file.write(orjson.dumps(snapshot.rows))
+
+    current = {"version": snapshot.version, "digest": snapshot.digest, "folder": folder}
+    tmp_path = os.path.join(knowledge_dir, "current.json.tmp")
+    with open(tmp_path, 'wb') as file:
+        file.write(orjson.dumps(current))
+    os.replace(tmp_path, os.path.join(knowledge_dir, "current.json"))
+
+    for name in os.listdir(knowledge_dir):
+        if name.startswith("v") and name != folder:
+            shutil.rmtree(os.path.join(knowledge_dir, name), ignore_errors=True)
+
+
+def load_snapshot(knowledge_dir, embeddings):
+    """
+    Load the last saved snapshot as (version, digest, rows, documents, vectorstore),
+    or None if nothing was saved. The FAISS index is memory-mapped when supported.
+    """
+    current_path = os.path.join(knowledge_dir, "current.json")
+    if not os.path.exists(current_path):
+        return None
+
+    with open(current_path, 'rb') as file:
+        current = orjson.loads(file.read())
+    folder = os.path.join(knowledge_dir, current["folder"])
+
+    index_path = os.path.join(folder, "index.faiss")
+    try:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(index_path)
+    with open(os.path.join(folder, "index.pkl"), 'rb') as file:
+        docstore, index_to_docstore_id = pickle.load(file)
+    with open(os.path.join(folder, "rows.json"), 'rb') as file:
+        rows = orjson.loads(file.read())
+
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
+    )
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    documents = {}
+    for position, docstore_id in index_to_docstore_id.items():
+        document = docstore.search(docstore_id)
+        documents[document.metadata["protocol"]] = (document.page_content, document.metadata, vectors[position].tolist())
+
+    return current["version"], current["digest"], rows, documents, vectorstore
@@ -0,0 +1,38 @@
+import os
+import re
+import fcntl
+from contextlib import contextmanager
+
+WALLET_LOCK_DIR = "./data/locks"
+
+
+class WalletLease:
+    """
+    Cross-process, per-wallet exclusive lock backed by an `flock`ed file.
+
+    The API and the rebalancer run in separate processes, each with its own
+    WalletExecutor, so the executor alone only orders a wallet's writes
+    within one process. Holding the lease around every write makes them
+    take turns on the wallet's nonce across processes too. The kernel drops
+    the lock if its holder dies, so a crashed process cannot wedge a wallet.
+    """
+
+    def __init__(self, lock_dir: str = WALLET_LOCK_DIR):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def _path(self, user_address):
+        return os.path.join(self.lock_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", user_address.lower()) + ".lock")
+
+    @contextmanager
+    def hold(self, user_address):
+        with open(self._path(user_address), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def run(self, user_address, func, *args, **kwargs):
+        with self.hold(user_address):
+            return func(*args, **kwargs)
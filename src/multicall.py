@@ -0,0 +1,91 @@
+import itertools
+import logging
+import numpy as np
+import requests
+from eth_utils import to_checksum_address
+from abi import abi_registry
+
+# Multicall3 is deployed at the same address on Base and Base Sepolia
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBalanceReader:
+    """
+    Reads `getAmountStakeByUser` for every (user, protocol) pair with as few
+    round-trips as possible, either through Multicall3 `aggregate3` or as
+    JSON-RPC batch requests of plain `eth_call`s, `chunk_size` calls at a time.
+    """
+
+    def __init__(self, w3, rpc_url: str, chunk_size: int = 500, mode: str = "multicall",
+                 multicall_address: str = MULTICALL3_ADDRESS, decimals: int = 6):
+        if mode not in ("multicall", "batch"):
+            raise ValueError(f"Unknown balance reader mode: {mode}")
+
+        self.w3 = w3
+        self.rpc_url = rpc_url
+        self.chunk_size = chunk_size
+        self.mode = mode
+        self.multicall_address = to_checksum_address(multicall_address)
+        self.scale = 10 ** decimals
+        self.session = requests.Session()
+        self._balance_of = abi_registry.function("MockStake", "getAmountStakeByUser")
+        self._aggregate3 = abi_registry.function("Multicall3", "aggregate3")
+
+    def read(self, user_addresses, protocol_addresses):
+        """
+        Return a users x protocols float matrix of readable staked amounts.
+        Pairs whose call failed are NaN; a chunk whose request failed as a
+        whole (RPC or transport error) leaves its block NaN and the rest
+        of the matrix is still read.
+        """
+        users = [to_checksum_address(address) for address in user_addresses]
+        protocols = [to_checksum_address(address) for address in protocol_addresses]
+        calls = [
+            (protocol, self._balance_of.encode(user))
+            for user, protocol in itertools.product(users, protocols)
+        ]
+
+        results = []
+        for start in range(0, len(calls), self.chunk_size):
+            chunk = calls[start:start + self.chunk_size]
+            try:
+                if self.mode == "multicall":
+                    results.extend(self._read_multicall(chunk))
+                else:
+                    results.extend(self._read_batch(chunk))
+            except Exception as e:
+                logger.warning("balance read failed for calls %d-%d: %s", start, start + len(chunk) - 1, e)
+                results.extend([None] * len(chunk))
+
+        balances = np.full(len(calls), np.nan)
+        for position, data in enumerate(results):
+            if data is not None and len(data) >= 32:
+                balances[position] = self._balance_of.decode(data)[0] / self.scale
+        return balances.reshape(len(users), len(protocols))
+
+    def _read_multicall(self, chunk):
+        calldata = self._aggregate3.encode([(target, True, data) for target, data in chunk])
+        raw = self.w3.eth.call({"to": self.multicall_address, "data": calldata})
+        (returned,) = self._aggregate3.decode(raw)
+        return [data if success else None for success, data in returned]
+
+    def _read_batch(self, chunk):
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": "eth_call",
+                "params": [{"to": target, "data": "0x" + data.hex()}, "latest"]
+            }
+            for request_id, (target, data) in enumerate(chunk)
+        ]
+        response = self.session.post(self.rpc_url, json=payload, timeout=30)
+        response.raise_for_status()
+
+        results = [None] * len(chunk)
+        for item in response.json():
+            if "result" in item:
+                results[item["id"]] = bytes.fromhex(item["result"][2:])
+        return results
@@ -0,0 +1,101 @@
+import time
+import numpy as np
+import requests
+from checker import STAKING_URL, get_data_staked_many, get_risk
+
+
+class RebalancePlanner:
+    """
+    Builds a rebalance plan for many users from one fetch of the staking feed.
+
+    The feed is turned into column arrays once, the best target protocol is
+    picked per risk class, and the moves for every user come out of a single
+    NumPy pass over the users x protocols balance matrix.
+    """
+
+    def __init__(self, feed=None):
+        self.feed = feed if feed is not None else requests.get(STAKING_URL).json()
+
+        self.protocols = [item['addressStaking'] for item in self.feed]
+        self.tokens = [item['addressToken'] for item in self.feed]
+        self.apy = np.array([float(item['apy']) for item in self.feed])
+        self.stablecoin = np.array([item['stablecoin'] is True for item in self.feed])
+
+        self.targets = self._targets()
+
+    def _targets(self):
+        """Index into `protocols` of the best target for each risk class (-1 if none)."""
+        stable_apy = np.where(self.stablecoin, self.apy, -np.inf)
+        low = int(np.argmax(stable_apy)) if self.stablecoin.any() else -1
+        best = int(np.argmax(self.apy)) if len(self.apy) else -1
+        return {"low": low, "medium": best, "high": best}
+
+    def plan(self, user_addresses, risks=None):
+        """
+        Return a reviewable plan: the targets per risk class, an ordered
+        list of moves (unstake -> swap -> stake) for every user, and an
+        outcome record for each user that failed to plan or has nothing to move.
+        """
+        user_addresses = list(user_addresses)
+        errors = {}
+        if risks is None:
+            risks = []
+            for user_address in user_addresses:
+                try:
+                    risks.append(get_risk(user_address))
+                except Exception as e:
+                    errors[user_address] = str(e)
+                    risks.append(None)
+
+        _, balances = get_data_staked_many(user_addresses, self.protocols, errors)
+
+        target = np.array([self.targets.get(risk, -1) for risk in risks], dtype=np.int64)
+        failed = np.array([user_address in errors for user_address in user_addresses], dtype=bool)
+        columns = np.arange(len(self.protocols))
+        # Same rule as before: any position worth at least one whole token that
+        # is not already sitting in the user's target protocol gets moved
+        staked = np.nan_to_num(balances, nan=0.0) >= 1
+        mask = staked & (target[:, None] >= 0) & (columns[None, :] != target[:, None]) & ~failed[:, None]
+
+        moves = []
+        for user_index, protocol_index in zip(*np.nonzero(mask)):
+            to_index = target[user_index]
+            moves.append({
+                "user_address": user_addresses[user_index],
+                "risk": risks[user_index],
+                "from_protocol": self.protocols[protocol_index],
+                "token_in": self.tokens[protocol_index],
+                "to_protocol": self.protocols[to_index],
+                "token_out": self.tokens[to_index],
+                "amount": float(balances[user_index, protocol_index]),
+                "apy_gain": float(self.apy[to_index] - self.apy[protocol_index])
+            })
+
+        return {
+            "created_at": time.time(),
+            "users": len(user_addresses),
+            "targets": {
+                risk: self.protocols[index] if index >= 0 else None
+                for risk, index in self.targets.items()
+            },
+            "moves": moves,
+            "outcomes": self._outcomes(user_addresses, risks, mask.any(axis=1), errors)
+        }
+
+    @staticmethod
+    def _outcomes(user_addresses, risks, has_moves, errors):
+        """Outcome records, in the engine's shape, for users that will not be executed."""
+        outcomes = []
+        for user_address, risk, moving in zip(user_addresses, risks, has_moves):
+            if moving:
+                continue
+            error = errors.get(user_address)
+            outcomes.append({
+                "user_address": user_address,
+                "risk": risk,
+                "status": "failed" if error else "skipped",
+                "moves": [],
+                "error": error,
+                "elapsed": 0.0
+            })
+        return outcomes
@@ -0,0 +1,166 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+import requests
+
+
+class TransactionReverted(Exception):
+    def __init__(self, tx_hash, receipt):
+        super().__init__(f"Transaction reverted: {tx_hash}")
+        self.tx_hash = tx_hash
+        self.receipt = receipt
+
+
+class ReceiptWatcher:
+    """
+    A single background thread that confirms every pending transaction.
+
+    Callers register a hash with `watch()` and get a Future. Each time the
+    chain head moves, the receipts of all pending hashes are fetched in
+    JSON-RPC batches of `batch_size`, and the matching futures are resolved.
+    Hashes still unconfirmed after `timeout` seconds fail with TimeoutError.
+    """
+
+    def __init__(self, rpc_url: str, poll_interval: float = 1.0, timeout: float = 120.0, batch_size: int = 200):
+        self.rpc_url = rpc_url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = requests.Session()
+
+        # tx_hash -> (future, submitted_at, deadline)
+        self._pending = {}
+        # Hashes registered since the last check; looked up without waiting for a new block
+        self._fresh = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_block = None
+
+        self.confirmed = 0
+        self.reverted = 0
+        self.timed_out = 0
+        self.batches = 0
+        self._latencies = deque(maxlen=1000)
+
+    def watch(self, tx_hash: str, timeout: Optional[float] = None) -> Future:
+        future = Future()
+        now = time.monotonic()
+        with self._lock:
+            existing = self._pending.get(tx_hash)
+            if existing is not None:
+                return existing[0]
+            self._pending[tx_hash] = (future, now, now + (timeout or self.timeout))
+            self._fresh.add(tx_hash)
+            self._ensure_started()
+        self._wakeup.set()
+        return future
+
+    def wait(self, tx_hash: str, timeout: Optional[float] = None):
+        """Block until `tx_hash` is mined and return its receipt; raise if it reverted."""
+        timeout = timeout or self.timeout
+        # The watcher expires the hash itself; the extra margin only guards against a dead watcher thread
+        receipt = self.watch(tx_hash, timeout).result(timeout + self.poll_interval + 30)
+        if receipt["status"] != 1:
+            raise TransactionReverted(tx_hash, receipt)
+        return receipt
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="receipt-watcher", daemon=True)
+            self._thread.start()
+
+    def _rpc(self, payload):
+        response = self.session.post(self.rpc_url, json=payload, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Receipt watcher poll failed: {e}")
+
+    def _poll(self):
+        # Expire first so waiters time out even while every RPC call is failing
+        self._expire()
+
+        with self._lock:
+            pending = list(self._pending)
+            fresh = [tx_hash for tx_hash in self._fresh if tx_hash in self._pending]
+            self._fresh.clear()
+        if not pending:
+            return
+
+        block = int(self._rpc({"jsonrpc": "2.0", "id": 0, "method": "eth_blockNumber", "params": []})["result"], 16)
+        if block != self._last_block:
+            self._last_block = block
+            to_check = pending
+        else:
+            to_check = fresh
+
+        for start in range(0, len(to_check), self.batch_size):
+            self._check_batch(to_check[start:start + self.batch_size])
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [tx_hash for tx_hash, (_, _, deadline) in self._pending.items() if deadline < now]
+            for tx_hash in expired:
+                future, _, _ = self._pending.pop(tx_hash)
+                self.timed_out += 1
+                future.set_exception(TimeoutError(f"Timed out waiting for receipt of {tx_hash}"))
+
+    def _check_batch(self, tx_hashes):
+        payload = [
+            {"jsonrpc": "2.0", "id": request_id, "method": "eth_getTransactionReceipt", "params": [tx_hash]}
+            for request_id, tx_hash in enumerate(tx_hashes)
+        ]
+        results = self._rpc(payload)
+        self.batches += 1
+
+        now = time.monotonic()
+        for item in results:
+            receipt = item.get("result")
+            if not receipt:
+                continue
+
+            tx_hash = tx_hashes[item["id"]]
+            receipt["status"] = int(receipt["status"], 16)
+            with self._lock:
+                entry = self._pending.pop(tx_hash, None)
+                if entry is None:
+                    continue
+                if receipt["status"] == 1:
+                    self.confirmed += 1
+                else:
+                    self.reverted += 1
+                self._latencies.append(now - entry[1])
+            entry[0].set_result(receipt)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pending = len(self._pending)
+
+        def percentile(q):
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else None
+
+        return {
+            "pending": pending,
+            "confirmed": self.confirmed,
+            "reverted": self.reverted,
+            "timed_out": self.timed_out,
+            "receipt_batches": self.batches,
+            "time_to_confirmation": {
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": latencies[-1] if latencies else None
+            }
+        }
@@ -0,0 +1,158 @@
+import re
+import hashlib
+import unicodedata
+from typing import List
+from pydantic import BaseModel, Field
+
+RISK_LEVELS = ("low", "medium", "high")
+
+
+def normalize_answers(data: str) -> str:
+    """
+    Canonical form of a questionnaire submission: Unicode-normalized, case-folded,
+    with whitespace collapsed and spacing around punctuation removed.
+    """
+    text = unicodedata.normalize("NFKC", data).casefold()
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([^\w\s])\s*", r"\1", text)
+    return text.strip()
+
+
+def answers_key(data: str) -> str:
+    return hashlib.sha256(normalize_answers(data).encode()).hexdigest()
+
+
+# The questionnaire the frontend asks; the classifier prompts are built around it
+RISK_QUESTIONS = (
+    "How do you feel about potential losses in staking investments?",
+    "How long are you willing to lock up your staked assets?",
+    "How do you assess smart contract security before staking?",
+    "What is your approach to diversification in staking?",
+    "How do you react to market fluctuations affecting your staked assets?"
+)
+
+BATCH_CLASSIFIER_PROMPT = (
+    "You are a risk profile classifier that evaluates users based on their responses to investment-related questions. "
+    "You will receive several numbered submissions, each from a different user. Classify each one independently. "
+    "When analyzing responses, consider factors like: age, investment experience, financial goals, time horizon, and risk tolerance. "
+    "The questions asked were: "
+    + " ".join(f"{index}. {question}" for index, question in enumerate(RISK_QUESTIONS, 1))
+    + " Return one entry per submission with its submission number and a risk of 'low', 'medium', or 'high'."
+)
+
+
+class SubmissionRisk(BaseModel):
+    submission: int = Field(description="Number of the submission being classified")
+    risk: str = Field(description="One of 'low', 'medium' or 'high'")
+
+
+class RiskBatch(BaseModel):
+    """Risk level of every numbered submission."""
+
+    risks: List[SubmissionRisk]
+
+
+def batch_prompt(submissions) -> str:
+    return "\n\n".join(f"Submission {index}:\n{text}" for index, text in enumerate(submissions, 1))
+
+
+def parse_batch(batch, count: int):
+    """
+    Risk level per submission from a structured RiskBatch reply, matched by
+    submission number so entries may come back in any order. A submission
+    without a valid entry, or every one if there is no reply, gets None.
+    """
+    risks = [None] * count
+    for entry in (batch.risks if batch is not None else []):
+        if 1 <= entry.submission <= count and entry.risk in RISK_LEVELS:
+            risks[entry.submission - 1] = entry.risk
+    return risks
+
+
+# Phrases that point to a risk level in answers to RISK_QUESTIONS, with weights
+RISK_KEYWORDS = {
+    "low": {
+        "sell": 1.0, "withdraw": 1.0, "panic": 1.5, "worried": 1.0, "nervous": 1.0, "avoid": 1.0,
+        "cannot afford": 2.0, "can't afford": 2.0, "no loss": 2.0, "not lose": 1.5, "safe": 1.0, "safety": 1.0,
+        "conservative": 2.0, "stable": 1.0, "stablecoin": 1.5, "short term": 1.0, "days": 0.5, "weeks": 0.5,
+        "only audited": 1.5, "audited": 0.5, "well known": 0.5, "spread": 0.5, "preserve": 1.5
+    },
+    "medium": {
+        "moderate": 2.0, "balanced": 2.0, "some loss": 1.5, "small loss": 1.5, "few months": 1.5, "months": 0.5,
+        "partially": 1.0, "some of": 0.5, "wait and see": 1.5, "mix": 1.0, "mixed": 1.0, "depends": 0.5,
+        "review": 0.5, "reasonable": 1.0, "rebalance": 1.0
+    },
+    "high": {
+        "aggressive": 2.0, "buy more": 2.0, "buy the dip": 2.0, "hold": 0.5, "years": 1.0, "long term": 1.0,
+        "indefinitely": 1.5, "comfortable with loss": 2.0, "accept loss": 1.5, "high yield": 1.5, "highest": 1.0,
+        "maximize": 1.5, "all in": 2.0, "one protocol": 1.0, "don't check": 1.0, "ignore": 1.0, "new protocol": 1.0,
+        "degen": 2.0, "leverage": 1.5, "opportunity": 1.0
+    }
+}
+
+NEGATIONS = ("not", "never", "no", "don't", "wouldn't", "won't", "avoid")
+
+
+class RiskScorer:
+    """
+    Deterministic keyword scorer for questionnaire answers.
+
+    Each matched phrase adds its weight to a level; a phrase preceded by a
+    negation within three words is ignored. The level with the most weight
+    wins, with confidence = its share of the total after add-one smoothing,
+    so a handful of consistent matches is needed to clear a high threshold.
+    """
+
+    def __init__(self, keywords=None, smoothing: float = 1.0):
+        self.keywords = keywords or RISK_KEYWORDS
+        self.smoothing = smoothing
+        self._patterns = {
+            level: [(re.compile(rf"\b{re.escape(phrase)}"), weight) for phrase, weight in phrases.items()]
+            for level, phrases in self.keywords.items()
+        }
+
+    def _negated(self, text, position):
+        preceding = text[:position].split()[-3:]
+        return any(word in NEGATIONS for word in preceding)
+
+    def score(self, data: str):
+        """Return (risk, confidence, weights) for a submission."""
+        text = normalize_answers(data).replace(",", " , ").replace(".", " . ")
+        weights = {}
+        for level, patterns in self._patterns.items():
+            weights[level] = sum(
+                weight
+                for pattern, weight in patterns
+                for match in pattern.finditer(text)
+                if not self._negated(text, match.start())
+            )
+
+        total = sum(weights.values()) + self.smoothing * len(weights)
+        risk = max(RISK_LEVELS, key=lambda level: weights.get(level, 0.0))
+        confidence = (weights.get(risk, 0.0) + self.smoothing) / total
+        return risk, confidence, weights
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) plus per-message overhead."""
+    return len(text) // 4 + 4
+
+
+def trim_history(messages, max_tokens: int):
+    """
+    Keep the most recent messages ({"role", "content"} dicts) that fit in
+    `max_tokens`, starting on a user turn. The last message is always kept.
+    """
+    kept = []
+    budget = max_tokens
+    for message in reversed(messages):
+        cost = approx_tokens(message["content"])
+        if kept and cost > budget:
+            break
+        kept.append(message)
+        budget -= cost
+    kept.reverse()
+
+    while len(kept) > 1 and kept[0]["role"] != "user":
+        kept.pop(0)
+    return kept
@@ -0,0 +1,22 @@
+import re
+
+# Tool subsets the agent can be built with; "full" is every tool
+ROUTES = ("full", "knowledge")
+
+# Words that mean the question needs the CDP wallet tools, not just the knowledge base
+WALLET_TERMS = re.compile(
+    r"\b(wallet|address|balance|send|transfer|mint|deploy|faucet|trade|swap|wrap|nft|register|basename|"
+    r"contract)\w*",
+    re.IGNORECASE
+)
+
+
+def route_query(query: str, mode: str = "keywords") -> str:
+    """
+    Pick the tool subset for a /query question. With mode "keywords",
+    recommendation and yield questions get the knowledge tools only; with
+    "off" every question gets the full toolset.
+    """
+    if mode == "off":
+        return "full"
+    return "full" if WALLET_TERMS.search(query) else "knowledge"
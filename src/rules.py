@@ -1,27 +1,64 @@
 from checker import *
 
-import os
+import time
+import logging
 import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 from cdp import Cdp, Wallet, WalletData
+from abi import abi_registry
+from executor import get_wallet_executor
+from lease import WALLET_LOCK_DIR, WalletLease
+from allowance import AllowanceCache
+from planner import RebalancePlanner
+from receipts import ReceiptWatcher
+from txpipeline import GAS_LIMITS, TransactionPipeline
 from utils import get_env_variable
 
+logger = logging.getLogger(__name__)
+
+OPTI_ROUTER = "0x9F7b08e2365BFf594C4227752741Cb696B9b6E71"
+
 class AgentWalletSync:
+    # Shared by every instance: the imported-wallet cache (also used by
+    # checker), the per-wallet executor, the cross-process wallet lease, one
+    # receipt watcher for all pending transactions, nonces and allowances
+    wallet_cache = wallet_cache
+    executor = get_wallet_executor()
+    lease = WalletLease(os.getenv("WALLET_LOCK_DIR", WALLET_LOCK_DIR))
+    receipts = ReceiptWatcher(
+        RPC_URL,
+        poll_interval=float(os.getenv("RECEIPT_POLL_INTERVAL", 1.0)),
+        timeout=float(os.getenv("RECEIPT_TIMEOUT", 120))
+    )
+    tx_pipeline = TransactionPipeline(w3, watcher=receipts)
+    allowances = AllowanceCache(
+        w3,
+        abi_registry,
+        GAS_LIMITS["approve"],
+        policy=os.getenv("APPROVAL_POLICY", "exact"),
+        standing_amount=int(os.getenv("STANDING_ALLOWANCE", 1_000_000)) * (10 ** 6)
+    )
+
     def __init__(self):
         self.api_key = get_env_variable("CDP_API_KEY_NAME")
         self.private_key = get_env_variable("CDP_API_KEY_PRIVATE_KEY")
-        self.file_path = "./data/wallet.json"
+        self.store = wallet_store
         Cdp.configure(self.api_key, self.private_key)
 
     def fetch_data(self, user_address):
-        existing_data = self._load_existing_data()
+        wallet = self.wallet_cache.get(user_address)
+        if wallet is not None:
+            return wallet
 
-        for entry in existing_data:
-            if entry["user_address"] == user_address:
-                wallet_data_dict = entry["data"]
-                wallet_data = WalletData.from_dict(wallet_data_dict)
-                wallet = Wallet.import_wallet(wallet_data)
-                
-                return wallet
+        entry = self.store.get(user_address)
+
+        if entry and entry.get("data"):
+            wallet_data = WalletData.from_dict(entry["data"])
+            wallet = Wallet.import_wallet(wallet_data)
+            self.wallet_cache.set(user_address, wallet)
+
+            return wallet
 
         print(f"No wallet data found for user address: {user_address}")
         return None
@@ -40,60 +77,50 @@ class AgentWalletSync:
                 return "0x134C06B12eA6b1c7419a08085E0de6bDA9A16dA2"
     
     def swap(self, user_address, spender, token_in, token_out, amount):
-        approve_abi = self._read_abi("./abi/MockToken.json")
+        return self._run(self._sync_swap, user_address, spender, token_in, token_out, amount)
+    
+    def stake(self, user_address, asset_id, spender, amount):
+        return self._run(self._sync_stake, user_address, asset_id, spender, amount)
+    
+    def unstake(self, user_address, protocol):
+        return self._run(self._sync_unstake, user_address, protocol)
+    
+    def _run(self, func, user_address, *args):
+        # The executor orders this process's legs per wallet; the lease (the
+        # same lock files as the API's AgentWallet) orders them against the
+        # API process, which has its own executor
+        return self.executor.submit(user_address, self.lease.run, user_address, func, user_address, *args).result()
+    
+    def _sync_swap(self, user_address, spender, token_in, token_out, amount):
         amount = int(amount) * (10 ** 6)
         
         wallet = self.fetch_data(user_address)
-        approve_incovation = wallet.invoke_contract(
-            contract_address=token_in,
-            abi=approve_abi,
-            method="approve",
-            args={"spender": spender, "amount": str(int(amount + 10))}
-        )
-        approve_incovation.wait()
-        
-        abi = self._read_abi("./abi/OptiFinance.json")
-        
-        invocation = wallet.invoke_contract(
-            contract_address="0x9F7b08e2365BFf594C4227752741Cb696B9b6E71",
-            abi=abi,
-            method="swap",
-            args={"tokenIn": token_in, "tokenOut": token_out, "amountIn": str(int(amount))}
+        # approve (only if the allowance is short) and swap go out back to back
+        return self.allowances.approve_and_call(
+            self.tx_pipeline,
+            wallet.default_address.export(),
+            token_in,
+            spender,
+            amount,
+            (OPTI_ROUTER, abi_registry.encode("OptiFinance", "swap", token_in, token_out, amount), GAS_LIMITS["swap"])
         )
-
-        invocation.wait()
-        
-        return invocation.transaction_hash
     
-    def stake(self, user_address, asset_id, spender, amount):
-        approve_abi = self._read_abi("./abi/MockToken.json")
+    def _sync_stake(self, user_address, asset_id, spender, amount):
         amount = int(amount) * (10 ** 6)
         
         wallet = self.fetch_data(user_address)
-        approve_incovation = wallet.invoke_contract(
-            contract_address=asset_id,
-            abi=approve_abi,
-            method="approve",
-            args={"spender": spender, "amount": str(int(amount + 10))}
-        )
-        approve_incovation.wait()
-        
-        abi = self._read_abi("./abi/MockStake.json")
-        
-        invocation = wallet.invoke_contract(
-            contract_address=spender,
-            abi=abi,
-            method="stake",
-            args={"_days": str(0), "_amount": str(int(amount))}
+        return self.allowances.approve_and_call(
+            self.tx_pipeline,
+            wallet.default_address.export(),
+            asset_id,
+            spender,
+            amount,
+            (spender, abi_registry.encode("MockStake", "stake", 0, amount), GAS_LIMITS["stake"])
         )
-
-        invocation.wait()
-        
-        return invocation.transaction_hash
     
     
-    def unstake(self, user_address, protocol):        
-        abi = self._read_abi("./abi/MockStake.json")
+    def _sync_unstake(self, user_address, protocol):        
+        abi = abi_registry.get("MockStake")
         wallet = self.fetch_data(user_address)
         invocation = wallet.invoke_contract(
             contract_address=protocol,
@@ -101,112 +128,115 @@ class AgentWalletSync:
             method="withdrawAll"
         )
 
-        invocation.wait()
+        self.receipts.wait(invocation.transaction_hash)
         
         return invocation.transaction_hash
 
 
-    def _read_abi(self, abi_path):
-        with open(abi_path, 'r') as file:
-            return orjson.loads(file.read())
-
-
-    def _load_existing_data(self):
-        if not os.path.exists(self.file_path):
-            return []
-
-        with open(self.file_path, 'rb') as file:
-            return orjson.loads(file.read())
-
-    def _save_data(self, data):
-        with open(self.file_path, 'wb') as file:
-            file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
-
-
-def handle_user(user_address: str):
-    user_risk = get_risk(user_address)
-    user_staked = get_data_staked(user_address)
+def execute_user_moves(user_address: str, moves):
+    """Execute one user's planned moves, one leg after another, and return its outcome record."""
+    started = time.monotonic()
+    outcome = {
+        "user_address": user_address,
+        "risk": moves[0]["risk"] if moves else None,
+        "status": "skipped",
+        "moves": [],
+        "error": None
+    }
     
-    match user_risk:
-        case "low":
-            handle_low_risk(user_address, user_staked)
-        case "medium":
-            handle_high_risk(user_address, user_staked)
-        case "high":
-            handle_high_risk(user_address, user_staked)
-
-
-def handle_low_risk(user_address, user_staked):
-    for i in range(len(user_staked)):
-        protocol, response_raw = get_apy(filter='highest')
-        result = handle_protocols(user_staked[i], protocol, response_raw)
-        
-        if result is None:
-            continue
-
-        from_protocol, token_ca, amount = result
-        try:
-            agent = AgentWalletSync()
-            agent.unstake(user_address, from_protocol)
-            agent.swap(user_address, spender="0x9F7b08e2365BFf594C4227752741Cb696B9b6E71", token_in=token_ca, token_out=protocol[2], amount=amount)
-            agent.stake(user_address, protocol[2], protocol[0], amount)
-            print("success")
-        except Exception as e:
-            print(e)
-    
-
-def handle_high_risk(user_address, user_staked):
-    for i in range(len(user_staked)):
-        protocol, response_raw = get_apy(filter='highest-best')
-        result = handle_protocols(user_staked[i], protocol, response_raw)
-        
-        if result is None:
-            continue
-
-        from_protocol, token_ca, amount = result
-        
-        try:
-            agent = AgentWalletSync()
-            agent.unstake(user_address, from_protocol)
-            agent.swap(user_address, spender="0x9F7b08e2365BFf594C4227752741Cb696B9b6E71", token_in=token_ca, token_out=protocol[2], amount=amount)
-            agent.stake(user_address, protocol[2], protocol[0], amount)
-            print("success")
-        except Exception as e:
-            print(e)
-
-
-def get_apy(filter):
-    result = requests.get('https://opti-backend.vercel.app/staking')
-    response = result.json()
-    
-    if filter == 'highest':
-        protocol = [(item['addressStaking'], float(item['apy']), item['addressToken']) for item in response if item['stablecoin'] is True]
-        highest_apy = max(protocol, key=lambda x: x[1])
+    try:
+        agent = AgentWalletSync()
+        for move in moves:
+            outcome["moves"].append(move_position(
+                agent,
+                user_address,
+                move["from_protocol"],
+                move["token_in"],
+                move["to_protocol"],
+                move["token_out"],
+                move["amount"]
+            ))
+    except Exception as e:
+        outcome["status"] = "failed"
+        outcome["error"] = str(e)
+    else:
+        if any(move["status"] == "failed" for move in outcome["moves"]):
+            outcome["status"] = "failed"
+        elif outcome["moves"]:
+            outcome["status"] = "success"
+
+    outcome["elapsed"] = time.monotonic() - started
+    return outcome
+
+
+def move_position(agent, user_address, from_protocol, token_in, to_protocol, token_out, amount):
+    """Unstake -> swap -> stake. Each leg waits for the previous one; a failed leg stops the move."""
+    move = {
+        "from_protocol": from_protocol,
+        "to_protocol": to_protocol,
+        "token_in": token_in,
+        "token_out": token_out,
+        "amount": amount,
+        "status": "success",
+        "txhash": {},
+        "error": None
+    }
+    try:
+        move["txhash"]["unstake"] = agent.unstake(user_address, from_protocol)
+        move["txhash"]["swap"] = agent.swap(user_address, spender=OPTI_ROUTER, token_in=token_in, token_out=token_out, amount=amount)
+        move["txhash"]["stake"] = agent.stake(user_address, token_out, to_protocol, amount)
+    except Exception as e:
+        move["status"] = "failed"
+        move["error"] = str(e)
+    return move
+
+
+class RebalanceEngine:
+    """
+    Rebalances users in parallel on a bounded thread pool. Everything for one
+    user runs inside a single task, so its legs keep their order.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("REBALANCE_CONCURRENCY", 8))
+
+    def run(self, user_addresses, handler):
+        outcomes = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(handler, address) for address in user_addresses]
+            for future in as_completed(futures):
+                outcome = future.result()
+                logger.info("rebalance %s", orjson.dumps(outcome).decode())
+                outcomes.append(outcome)
+        return outcomes
+
+    def execute(self, plan):
+        moves_by_user = {}
+        for move in plan["moves"]:
+            moves_by_user.setdefault(move["user_address"], []).append(move)
+
+        return self.run(
+            moves_by_user,
+            lambda user_address: execute_user_moves(user_address, moves_by_user[user_address])
+        )
 
-        return highest_apy, response
-    
-    elif filter == 'highest-best':
-        protocol = [(item['addressStaking'], float(item['apy']), item['addressToken']) for item in response]
-        highest_apy = max(protocol, key=lambda x: x[1])
 
-        return highest_apy, response
-    
+def runner(max_workers: Optional[int] = None, dry_run: bool = False):
+    address_list = wallet_store.addresses()
+    plan = RebalancePlanner().plan(address_list)
+    logger.info("rebalance plan: %d moves for %d users, targets %s", len(plan["moves"]), plan["users"], plan["targets"])
+    for outcome in plan["outcomes"]:
+        logger.info("rebalance %s", orjson.dumps(outcome).decode())
 
-def handle_protocols(user_staked, protocol, response):
-    for item in [user_staked]:
-        protocol_address = item['protocol']
-        if protocol_address != protocol[0]:
-            token_ca = [item['addressToken'] for item in response if item['addressStaking'] == protocol_address][0]
-            return item['protocol'], token_ca, item['amount']
-    return None
+    if dry_run:
+        for move in plan["moves"]:
+            logger.info("planned %s", orjson.dumps(move).decode())
+        return plan
 
+    outcomes = RebalanceEngine(max_workers).execute(plan) + plan["outcomes"]
 
-def runner():
-    with open('./data/wallet.json', 'rb') as file:
-        existing_data =  orjson.loads(file.read())
-        
-    address_list = [item['user_address'] for item in existing_data]
-    for address in address_list:
-        handle_user(address)
+    summary = {status: sum(1 for o in outcomes if o["status"] == status) for status in ("success", "failed", "skipped")}
+    logger.info("rebalance finished for %d users: %s", len(outcomes), summary)
+    return outcomes
 
 
@@ -0,0 +1,57 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    work, callers arriving while it is in flight await the same result.
+    Nothing is kept once the call finishes, so this is not a cache. If every
+    caller gives up, the work itself is cancelled.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.executions = 0
+        self.abandoned = 0
+
+    async def do(self, key, fn):
+        """Run `fn()` (a coroutine function) once for all concurrent callers with `key`."""
+        self.calls += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            self.executions += 1
+            future = asyncio.ensure_future(fn())
+            # [future, number of callers still waiting on it]
+            entry = self._inflight[key] = [future, 0]
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        future = entry[0]
+        entry[1] += 1
+        try:
+            # A caller giving up (e.g. on timeout) must not cancel the work for the others
+            return await asyncio.shield(future)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not future.done():
+                self.abandoned += 1
+                future.cancel()
+
+    def _forget(self, key, future):
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            future.exception()
+
+    def stats(self):
+        coalesced = self.calls - self.executions
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "abandoned": self.abandoned,
+            "coalescing_rate": coalesced / self.calls if self.calls else 0.0
+        }
@@ -0,0 +1,226 @@
+import os
+import sys
+import sqlite3
+import threading
+import orjson
+from typing import Optional
+
+WALLET_JSON_PATH = "./data/wallet.json"
+WALLET_DB_PATH = "./data/wallet.db"
+
+
+class JsonWalletStore:
+    """Legacy backend: the whole store is a single pretty-printed JSON list."""
+
+    def __init__(self, file_path: str = WALLET_JSON_PATH):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def get(self, user_address):
+        for entry in self._load():
+            if entry["user_address"] == user_address:
+                return entry
+        return None
+
+    def get_risk_profile(self, user_address):
+        entry = self.get(user_address)
+        return entry.get("risk_profile") if entry else None
+
+    def addresses(self):
+        return [entry["user_address"] for entry in self._load() if entry.get("data")]
+
+    def add(self, user_address, data):
+        with self._lock:
+            existing_data = self._load()
+            for entry in existing_data:
+                if entry["user_address"] == user_address:
+                    if entry.get("data"):
+                        return False
+                    entry["data"] = data
+                    break
+            else:
+                existing_data.append({"user_address": user_address, "data": data})
+            self._save(existing_data)
+            return True
+
+    def set_risk_profile(self, user_address, risk_profile):
+        with self._lock:
+            existing_data = self._load()
+            for entry in existing_data:
+                if entry["user_address"] == user_address:
+                    entry["risk_profile"] = risk_profile
+                    break
+            else:
+                existing_data.append({"user_address": user_address, "data": None, "risk_profile": risk_profile})
+            self._save(existing_data)
+
+    def get_address(self, user_address):
+        entry = self.get(user_address)
+        return entry.get("address") if entry else None
+
+    def set_address(self, user_address, address):
+        with self._lock:
+            existing_data = self._load()
+            for entry in existing_data:
+                if entry["user_address"] == user_address:
+                    entry["address"] = address
+                    self._save(existing_data)
+                    return
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return []
+
+        with open(self.file_path, 'rb') as file:
+            return orjson.loads(file.read())
+
+    def _save(self, data):
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self.file_path)
+
+
+class SqliteWalletStore:
+    """Embedded SQLite backend in WAL mode, one row per user keyed by user_address."""
+
+    def __init__(self, db_path: str = WALLET_DB_PATH, legacy_json_path: Optional[str] = WALLET_JSON_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        created = self._create_schema()
+        if created and legacy_json_path and os.path.exists(legacy_json_path):
+            imported = self.import_json(legacy_json_path)
+            print(f"Imported {imported} wallets from {legacy_json_path} into {db_path}")
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._conn
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wallets'"
+        ).fetchone()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallets ("
+            " user_address TEXT PRIMARY KEY,"
+            " data BLOB,"
+            " risk_profile TEXT,"
+            " address TEXT"
+            ") WITHOUT ROWID"
+        )
+        # Stores created before the address column existed
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(wallets)")]
+        if "address" not in columns:
+            conn.execute("ALTER TABLE wallets ADD COLUMN address TEXT")
+        return exists is None
+
+    def get(self, user_address):
+        row = self._conn.execute(
+            "SELECT user_address, data, risk_profile, address FROM wallets WHERE user_address = ?",
+            (user_address,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "user_address": row[0],
+            "data": orjson.loads(row[1]) if row[1] is not None else None,
+            "risk_profile": row[2],
+            "address": row[3]
+        }
+
+    def get_risk_profile(self, user_address):
+        row = self._conn.execute(
+            "SELECT risk_profile FROM wallets WHERE user_address = ?",
+            (user_address,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def addresses(self):
+        rows = self._conn.execute("SELECT user_address FROM wallets WHERE data IS NOT NULL")
+        return [row[0] for row in rows]
+
+    def add(self, user_address, data):
+        cursor = self._conn.execute(
+            "INSERT INTO wallets (user_address, data) VALUES (?, ?) "
+            "ON CONFLICT(user_address) DO UPDATE SET data = excluded.data WHERE wallets.data IS NULL",
+            (user_address, orjson.dumps(data))
+        )
+        return cursor.rowcount > 0
+
+    def set_risk_profile(self, user_address, risk_profile):
+        self._conn.execute(
+            "INSERT INTO wallets (user_address, risk_profile) VALUES (?, ?) "
+            "ON CONFLICT(user_address) DO UPDATE SET risk_profile = excluded.risk_profile",
+            (user_address, risk_profile)
+        )
+
+    def get_address(self, user_address):
+        """On-chain address of the user's agent wallet, if it has been recorded."""
+        row = self._conn.execute(
+            "SELECT address FROM wallets WHERE user_address = ?",
+            (user_address,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_address(self, user_address, address):
+        self._conn.execute(
+            "UPDATE wallets SET address = ? WHERE user_address = ?",
+            (address, user_address)
+        )
+
+    def import_json(self, json_path: str = WALLET_JSON_PATH):
+        with open(json_path, 'rb') as file:
+            entries = orjson.loads(file.read())
+
+        rows = [
+            (
+                entry["user_address"],
+                orjson.dumps(entry["data"]) if entry.get("data") is not None else None,
+                entry.get("risk_profile")
+            )
+            for entry in entries
+        ]
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO wallets (user_address, data, risk_profile) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_address) DO UPDATE SET "
+                " data = COALESCE(wallets.data, excluded.data),"
+                " risk_profile = COALESCE(excluded.risk_profile, wallets.risk_profile)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+
+def open_wallet_store(backend: Optional[str] = None):
+    backend = backend or os.getenv("WALLET_STORE", "sqlite")
+
+    match backend:
+        case "sqlite":
+            return SqliteWalletStore(os.getenv("WALLET_DB_PATH", WALLET_DB_PATH))
+        case "json":
+            return JsonWalletStore(os.getenv("WALLET_JSON_PATH", WALLET_JSON_PATH))
+        case _:
+            raise ValueError(f"Unknown wallet store backend: {backend}")
+
+
+if __name__ == "__main__":
+    # One-shot import: python src/store.py [wallet.json] [wallet.db]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else WALLET_JSON_PATH
+    db_path = sys.argv[2] if len(sys.argv) > 2 else WALLET_DB_PATH
+
+    store = SqliteWalletStore(db_path, legacy_json_path=None)
+    print(f"Imported {store.import_json(json_path)} wallets from {json_path} into {db_path}")
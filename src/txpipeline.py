@@ -0,0 +1,153 @@
+"""
+Local signing for approve + swap/stake.
+
+CDP's invoke_contract signs server-side and picks each nonce itself, so an
+approve and the call that spends it could only go out one confirmation
+apart. For those two actions the wallet's key is exported from the CDP
+wallet (`default_address.export()`), used to sign here, and dropped when
+the action returns; it is never stored or logged. Every other write
+(unstake, mint, transfer, faucet) still goes through CDP.
+
+Both kinds of write share the sender's nonce sequence. Each runs on the
+per-wallet executor while holding the wallet's lease (src/lease.py), so
+only one action per wallet writes at a time, across the API and rebalancer
+processes. The pipeline never remembers nonces between sends: each send
+starts from the node's pending count, so a CDP transaction in between is
+always accounted for.
+"""
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from eth_account import Account
+from eth_utils import to_checksum_address
+from web3.exceptions import TransactionNotFound
+
+# Dependent calls cannot be estimated before the approve they rely on is
+# mined, so the pipeline sends them with fixed limits.
+GAS_LIMITS = {
+    "approve": 100_000,
+    "swap": 500_000,
+    "stake": 300_000
+}
+
+
+class TransactionFailed(Exception):
+    def __init__(self, message, index, tx_hash=None):
+        super().__init__(message)
+        self.index = index
+        self.tx_hash = tx_hash
+
+
+class NonceManager:
+    """
+    Assigns consecutive nonces to a sequence of calls from one sender,
+    starting from the node's pending count. The sender stays locked until the
+    sequence has been sent, so the next reservation sees it as pending, and
+    nothing is cached that a transaction sent elsewhere could make stale.
+    The lock is per process; callers hold the wallet lease for the rest.
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._locks = defaultdict(threading.Lock)
+
+    @contextmanager
+    def reserve(self, address, count=1):
+        with self._locks[address]:
+            start = self.w3.eth.get_transaction_count(address, "pending")
+            yield list(range(start, start + count))
+
+
+class TransactionPipeline:
+    """
+    Signs and sends a sequence of dependent calls from one key in consecutive
+    nonces without waiting in between, then waits for all receipts together.
+    """
+
+    def __init__(self, w3, watcher=None, timeout: float = 120.0, poll_interval: float = 1.0):
+        self.w3 = w3
+        self.watcher = watcher
+        self.nonces = NonceManager(w3)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._chain_id = None
+
+    @property
+    def chain_id(self):
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        return self._chain_id
+
+    def submit(self, private_key, calls):
+        """
+        Send `calls` ([(to, data, gas), ...]) in order and return their hashes.
+        `gas=None` means estimate, which only works for the first call.
+        """
+        account = Account.from_key(private_key)
+
+        priority_fee = self.w3.eth.max_priority_fee
+        base_fee = self.w3.eth.get_block("pending")["baseFeePerGas"]
+        max_fee = 2 * base_fee + priority_fee
+
+        tx_hashes = []
+        with self.nonces.reserve(account.address, len(calls)) as nonces:
+            for index, ((to, data, gas), nonce) in enumerate(zip(calls, nonces)):
+                tx = {
+                    "chainId": self.chain_id,
+                    "from": account.address,
+                    "to": to_checksum_address(to),
+                    "data": data,
+                    "nonce": nonce,
+                    "value": 0,
+                    "maxFeePerGas": max_fee,
+                    "maxPriorityFeePerGas": priority_fee
+                }
+                try:
+                    tx["gas"] = gas or self.w3.eth.estimate_gas(tx)
+                    signed = account.sign_transaction(tx)
+                    tx_hashes.append(self.w3.to_hex(self.w3.eth.send_raw_transaction(signed.raw_transaction)))
+                except Exception as e:
+                    raise TransactionFailed(f"Failed to send transaction {index}: {e}", index) from e
+        return tx_hashes
+
+    def wait(self, tx_hashes):
+        """Wait for every receipt; raise for the first transaction that reverted."""
+        if self.watcher is not None:
+            futures = [self.watcher.watch(tx_hash, self.timeout) for tx_hash in tx_hashes]
+            # The watcher fails each future at its own deadline; this only guards against a dead watcher
+            deadline = time.monotonic() + self.timeout + self.watcher.poll_interval + 30
+            ordered = [future.result(max(deadline - time.monotonic(), 0)) for future in futures]
+        else:
+            ordered = self._poll_receipts(tx_hashes)
+
+        for index, receipt in enumerate(ordered):
+            if receipt["status"] != 1:
+                raise TransactionFailed(f"Transaction {index} reverted: {tx_hashes[index]}", index, tx_hashes[index])
+        return ordered
+
+    def _poll_receipts(self, tx_hashes):
+        deadline = time.monotonic() + self.timeout
+        receipts = {}
+        while len(receipts) < len(tx_hashes):
+            for tx_hash in tx_hashes:
+                if tx_hash in receipts:
+                    continue
+                try:
+                    receipts[tx_hash] = self.w3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    pass
+            if len(receipts) < len(tx_hashes):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for {len(tx_hashes) - len(receipts)} transactions")
+                time.sleep(self.poll_interval)
+
+        return [receipts[tx_hash] for tx_hash in tx_hashes]
+
+    def execute(self, private_key, calls, on_submitted=None):
+        tx_hashes = self.submit(private_key, calls)
+        if on_submitted is not None:
+            on_submitted(tx_hashes[-1])
+
+        self.wait(tx_hashes)
+        return tx_hashes
@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Token usage of one agent run, collected from every LLM call it makes."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_calls = 0
+        # LLM calls made by the agent node itself; each one carries the tool schemas
+        self.agent_steps = 0
+
+    def on_chat_model_start(self, serialized, messages, *, metadata=None, **kwargs):
+        if (metadata or {}).get("langgraph_node") == "agent":
+            self.agent_steps += 1
+
+    def on_llm_end(self, response, **kwargs):
+        self.llm_calls += 1
+        found = False
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    found = True
+                    self.prompt_tokens += usage.get("input_tokens", 0)
+                    self.completion_tokens += usage.get("output_tokens", 0)
+
+        if not found:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+
+
+class UsageTracker:
+    """
+    Per-route totals of LLM token usage across /query runs, including the
+    prompt tokens spent on tool schemas and those saved by tool routing.
+    """
+
+    def __init__(self, recent: int = 50):
+        self._routes = {}
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record(self, route, usage: UsageCallback, schema_tokens: int, full_schema_tokens: int):
+        request = {
+            "route": route,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "llm_calls": usage.llm_calls,
+            "agent_steps": usage.agent_steps,
+            "tool_schema_tokens": schema_tokens * usage.agent_steps,
+            "tool_schema_tokens_saved": (full_schema_tokens - schema_tokens) * usage.agent_steps
+        }
+        with self._lock:
+            totals = self._routes.setdefault(route, {"requests": 0})
+            totals["requests"] += 1
+            for key, value in request.items():
+                if key != "route":
+                    totals[key] = totals.get(key, 0) + value
+            self._recent.append(request)
+        return request
+
+    def stats(self):
+        with self._lock:
+            routes = {route: dict(totals) for route, totals in self._routes.items()}
+            recent = list(self._recent)
+
+        for totals in routes.values():
+            totals["prompt_tokens_per_request"] = totals["prompt_tokens"] / totals["requests"]
+        return {
+            "routes": routes,
+            "tool_schema_tokens_saved": sum(totals["tool_schema_tokens_saved"] for totals in routes.values()),
+            "recent": recent
+        }
@@ -1,73 +1,171 @@
 import os
-import orjson
+import asyncio
+from typing import Optional
 from cdp import Cdp, Wallet, WalletData
+from web3 import Web3
+from src.abi import abi_registry
+from src.allowance import AllowanceCache
+from src.cache import TTLCache
+from src.executor import WalletExecutor, get_wallet_executor
+from src.lease import WALLET_LOCK_DIR, WalletLease
+from src.receipts import ReceiptWatcher
+from src.store import open_wallet_store
+from src.txpipeline import GAS_LIMITS, TransactionPipeline
 from src.utils import get_env_variable
 
+OPTI_ROUTER = "0x9F7b08e2365BFf594C4227752741Cb696B9b6E71"
+RPC_URL = os.getenv("RPC_URL", "https://api.developer.coinbase.com/rpc/v1/base-sepolia/vIyOU1PrjnUku5b1y2FGu416eItcu3KH")
+
+
 class AgentWallet:
-    def __init__(self):
+    """
+    Wallet actions for API users. The CDP SDK is synchronous, so every action
+    runs as a `_sync_*` method on the shared WalletExecutor and the async
+    methods only await it, keeping the event loop free while transactions
+    confirm. The executor runs one action at a time per user wallet, in
+    arrival order, and different wallets in parallel. Actions that write
+    also hold the wallet's lease, so they take turns with the rebalancer
+    process as well.
+
+    Actions accept an optional `on_submitted(txhash)` callback that fires as
+    soon as the final transaction is broadcast, before it is confirmed.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
         self.api_key = get_env_variable("CDP_API_KEY_NAME")
         self.private_key = get_env_variable("CDP_API_KEY_PRIVATE_KEY")
-        self.file_path = "./data/wallet.json"
+        self.store = open_wallet_store()
+        self.wallet_cache = TTLCache(
+            maxsize=int(os.getenv("WALLET_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("WALLET_CACHE_TTL", 600))
+        )
+        self.executor = WalletExecutor(max_workers) if max_workers else get_wallet_executor()
+        self.lease = WalletLease(os.getenv("WALLET_LOCK_DIR", WALLET_LOCK_DIR))
+        self.w3 = Web3(Web3.HTTPProvider(RPC_URL))
+        self.receipts = ReceiptWatcher(
+            RPC_URL,
+            poll_interval=float(os.getenv("RECEIPT_POLL_INTERVAL", 1.0)),
+            timeout=float(os.getenv("RECEIPT_TIMEOUT", 120))
+        )
+        self.tx_pipeline = TransactionPipeline(self.w3, watcher=self.receipts)
+        self.allowances = AllowanceCache(
+            self.w3,
+            abi_registry,
+            GAS_LIMITS["approve"],
+            policy=os.getenv("APPROVAL_POLICY", "exact"),
+            standing_amount=int(os.getenv("STANDING_ALLOWANCE", 1_000_000)) * (10 ** 6)
+        )
         Cdp.configure(self.api_key, self.private_key)
 
+    async def _run(self, func, user_address, *args, **kwargs):
+        return await asyncio.wrap_future(
+            self.executor.submit(user_address, self.lease.run, user_address, func, user_address, *args, **kwargs)
+        )
+
     async def create_wallet(self, user_address):
-        existing_data = await self._load_existing_data()
-        
-        for entry in existing_data:
-            if entry["user_address"] == user_address:
-                print(f"Wallet already exists for user address: {user_address}")
-                return
-        
+        return await self._run(self._sync_create_wallet, user_address)
+
+    async def save_wallet_data(self, wallet_data, user_address):
+        return await asyncio.wrap_future(
+            self.executor.submit(user_address, self._sync_save_wallet_data, wallet_data, user_address)
+        )
+
+    async def _run_read(self, func, user_address):
+        # Reads get their own queue so they never wait behind a pending transaction
+        return await asyncio.wrap_future(self.executor.submit((user_address, "read"), func, user_address))
+
+    async def fetch_data(self, user_address):
+        return await self._run_read(self._sync_fetch_data, user_address)
+
+    async def _check_address(self, user_address):
+        return await self._run_read(self._sync_check_address, user_address)
+
+    async def onboard(self, user_address):
+        """Create the wallet and fund it as one operation, so nothing queued for it runs in between."""
+        return await self._run(self._sync_onboard, user_address)
+
+    # Fund wallet via mpc
+    async def _fund_wallet(self, user_address):
+        return await self._run(self._sync_fund_wallet, user_address)
+
+    async def _transfer(self, user_address, amount, asset_id, destination):
+        return await self._run(self._sync_transfer_asset, user_address, amount, asset_id, destination)
+
+    async def mint(self, user_address, asset_id, amount, on_submitted=None):
+        return await self._run(self._sync_mint, user_address, asset_id, amount, on_submitted)
+
+    async def transfer(self, user_address, contract_address, to, amount, on_submitted=None):
+        return await self._run(self._sync_transfer, user_address, contract_address, to, amount, on_submitted)
+
+    async def swap(self, user_address, spender, token_in, token_out, amount, on_submitted=None):
+        return await self._run(self._sync_swap, user_address, spender, token_in, token_out, amount, on_submitted)
+
+    async def stake(self, user_address, asset_id, protocol, spender, amount, on_submitted=None):
+        return await self._run(self._sync_stake, user_address, asset_id, protocol, spender, amount, on_submitted)
+
+    async def unstake(self, user_address, protocol, on_submitted=None):
+        return await self._run(self._sync_unstake, user_address, protocol, on_submitted)
+
+    def _sync_create_wallet(self, user_address):
+        entry = self.store.get(user_address)
+        if entry and entry.get("data"):
+            print(f"Wallet already exists for user address: {user_address}")
+            return
+
         wallet = Wallet.create(network_id="base-sepolia")
         wallet_data = wallet.export_data()
-        await self.save_wallet_data(wallet_data, user_address)
-        
+        self._sync_save_wallet_data(wallet_data, user_address)
+        # Lets the rebalancer read balances without importing the wallet
+        self.store.set_address(user_address, wallet.default_address.address_id)
 
-    async def save_wallet_data(self, wallet_data, user_address):
+    def _sync_onboard(self, user_address):
+        self._sync_create_wallet(user_address)
+        return self._sync_fund_wallet(user_address)
+
+    def _sync_save_wallet_data(self, wallet_data, user_address):
         wallet_data_dict = wallet_data.to_dict()
-        output_data = {
-            "user_address": user_address,
-            "data": wallet_data_dict
-        }
-
-        existing_data = await self._load_existing_data()
-        existing_data.append(output_data)
-        await self._save_data(existing_data)
+
+        if not self.store.add(user_address, wallet_data_dict):
+            print(f"Wallet already exists for user address: {user_address}")
+            return
+        self.wallet_cache.invalidate(user_address)
         print("Wallet data saved successfully.")
 
-    async def fetch_data(self, user_address):
-        existing_data = await self._load_existing_data()
+    def _sync_fetch_data(self, user_address):
+        wallet = self.wallet_cache.get(user_address)
+        if wallet is not None:
+            return wallet
+
+        entry = self.store.get(user_address)
+
+        if entry and entry.get("data"):
+            wallet_data = WalletData.from_dict(entry["data"])
+            wallet = Wallet.import_wallet(wallet_data)
+            self.wallet_cache.set(user_address, wallet)
 
-        for entry in existing_data:
-            if entry["user_address"] == user_address:
-                wallet_data_dict = entry["data"]
-                wallet_data = WalletData.from_dict(wallet_data_dict)
-                wallet = Wallet.import_wallet(wallet_data)
-                
-                return wallet
+            return wallet
 
         print(f"No wallet data found for user address: {user_address}")
         return None
-    
-    async def _check_address(self, user_address):
-        wallet = await self.fetch_data(user_address)
+
+    def _sync_check_address(self, user_address):
+        wallet = self._sync_fetch_data(user_address)
         address = wallet.default_address
         return address.address_id
-    
-    # Fund wallet via mpc
-    async def _fund_wallet(self, user_address):
-        wallet = await self.fetch_data(user_address)
+
+    def _sync_fund_wallet(self, user_address):
+        wallet = self._sync_fetch_data(user_address)
         faucet = wallet.faucet(asset_id='eth')
-        faucet.wait()
+        self.receipts.wait(faucet.transaction_hash)
         return faucet.transaction_hash
-    
-    async def _transfer(self, user_address, amount, asset_id, destination):
-        wallet = await self.fetch_data(user_address)
+
+    def _sync_transfer_asset(self, user_address, amount, asset_id, destination):
+        wallet = self._sync_fetch_data(user_address)
         transaction = wallet.transfer(amount, asset_id, destination)
-        transaction.wait()
+        self.receipts.wait(transaction.transaction_hash)
         return transaction.transaction_hash
-    
-    async def _get_token_ca(self, asset_id):
+
+    def _get_token_ca(self, asset_id):
         match asset_id:
             case "usdc":
                 return "0x0E8Ac3cc5183A243FcbA007136135A14831fDA99"
@@ -79,8 +177,8 @@ class AgentWallet:
                 return "0xbF1876d7643a1d7DA52C7B8a67e7D86aeeAA12A6"
             case "dai":
                 return "0x134C06B12eA6b1c7419a08085E0de6bDA9A16dA2"
-    
-    async def _get_protocol_ca(self, protocol):
+
+    def _get_protocol_ca(self, protocol):
         match protocol:
             case "uniswap":
                 return "0xa42A86906D3FDfFE7ccc1a4E143e5Ddd8dF0Cf83"
@@ -92,121 +190,87 @@ class AgentWallet:
                 return "0x0CAf83Ef2BA9242F174FCE98E30B9ceba299aaa3"
             case "aavev3":
                 return "0x5dC10711C60dd5174306aEC6Fb1c78b895C9fA5A"
-    
-    async def mint(self, user_address, asset_id, amount):
+
+    def _submitted(self, invocation, on_submitted):
+        if on_submitted is not None:
+            on_submitted(invocation.transaction_hash)
+
+    def _sync_mint(self, user_address, asset_id, amount, on_submitted=None):
         amount = int(amount) * (10 ** 6)
-        abi = await self._read_abi("./abi/MockToken.json")
-        
-        wallet = await self.fetch_data(user_address)
+        abi = abi_registry.get("MockToken")
+
+        wallet = self._sync_fetch_data(user_address)
         address = wallet.default_address.address_id
-        
+
         invocation = wallet.invoke_contract(
-            contract_address=await self._get_token_ca(asset_id),
+            contract_address=self._get_token_ca(asset_id),
             abi=abi,
             method="mint",
             args={"to": address, "amount": str(int(amount))}
         )
+        self._submitted(invocation, on_submitted)
+
+        self.receipts.wait(invocation.transaction_hash)
 
-        invocation.wait()
-        
         return invocation.transaction_hash
-    
-    async def transfer(self, user_address, contract_address, to, amount):
+
+    def _sync_transfer(self, user_address, contract_address, to, amount, on_submitted=None):
         amount = int(amount) * (10 ** 6)
-        abi = await self._read_abi("./abi/MockToken.json")
-        
-        wallet = await self.fetch_data(user_address)
-        
+        abi = abi_registry.get("MockToken")
+
+        wallet = self._sync_fetch_data(user_address)
+
         invocation = wallet.invoke_contract(
             contract_address=contract_address,
             abi=abi,
             method="transfer",
             args={"to": str(to), "value": str(int(amount))}
         )
+        self._submitted(invocation, on_submitted)
+
+        self.receipts.wait(invocation.transaction_hash)
 
-        invocation.wait()
-        
         return invocation.transaction_hash
-    
-    async def swap(self, user_address, spender, token_in, token_out, amount):
-        approve_abi = await self._read_abi("./abi/MockToken.json")
+
+    def _sync_swap(self, user_address, spender, token_in, token_out, amount, on_submitted=None):
         amount = int(amount) * (10 ** 6)
-        
-        wallet = await self.fetch_data(user_address)
-        approve_incovation = wallet.invoke_contract(
-            contract_address=token_in,
-            abi=approve_abi,
-            method="approve",
-            args={"spender": spender, "amount": str(int(amount + 10))}
-        )
-        approve_incovation.wait()
-        
-        abi = await self._read_abi("./abi/OptiFinance.json")
-        
-        invocation = wallet.invoke_contract(
-            contract_address="0x9F7b08e2365BFf594C4227752741Cb696B9b6E71",
-            abi=abi,
-            method="swap",
-            args={"tokenIn": token_in, "tokenOut": token_out, "amountIn": str(int(amount))}
+
+        wallet = self._sync_fetch_data(user_address)
+        # approve (only if the allowance is short) and swap go out back to back
+        return self.allowances.approve_and_call(
+            self.tx_pipeline,
+            wallet.default_address.export(),
+            token_in,
+            spender,
+            amount,
+            (OPTI_ROUTER, abi_registry.encode("OptiFinance", "swap", token_in, token_out, amount), GAS_LIMITS["swap"]),
+            on_submitted
         )
 
-        invocation.wait()
-        
-        return invocation.transaction_hash
-    
-    async def stake(self, user_address, asset_id, protocol, spender, amount):
-        approve_abi = await self._read_abi("./abi/MockToken.json")
+    def _sync_stake(self, user_address, asset_id, protocol, spender, amount, on_submitted=None):
         amount = int(amount) * (10 ** 6)
-        
-        wallet = await self.fetch_data(user_address)
-        approve_incovation = wallet.invoke_contract(
-            contract_address=await self._get_token_ca(asset_id),
-            abi=approve_abi,
-            method="approve",
-            args={"spender": spender, "amount": str(int(amount + 10))}
-        )
-        approve_incovation.wait()
-        
-        abi = await self._read_abi("./abi/MockStake.json")
-        
-        invocation = wallet.invoke_contract(
-            contract_address=await self._get_protocol_ca(protocol),
-            abi=abi,
-            method="stake",
-            args={"_days": str(0), "_amount": str(int(amount))}
+
+        wallet = self._sync_fetch_data(user_address)
+        return self.allowances.approve_and_call(
+            self.tx_pipeline,
+            wallet.default_address.export(),
+            self._get_token_ca(asset_id),
+            spender,
+            amount,
+            (self._get_protocol_ca(protocol), abi_registry.encode("MockStake", "stake", 0, amount), GAS_LIMITS["stake"]),
+            on_submitted
         )
 
-        invocation.wait()
-        
-        return invocation.transaction_hash
-    
-    
-    async def unstake(self, user_address, protocol):        
-        abi = await self._read_abi("./abi/MockStake.json")
-        wallet = await self.fetch_data(user_address)
+    def _sync_unstake(self, user_address, protocol, on_submitted=None):
+        abi = abi_registry.get("MockStake")
+        wallet = self._sync_fetch_data(user_address)
         invocation = wallet.invoke_contract(
-            contract_address=await self._get_protocol_ca(protocol),
+            contract_address=self._get_protocol_ca(protocol),
             abi=abi,
             method="withdrawAll"
         )
+        self._submitted(invocation, on_submitted)
 
-        invocation.wait()
-        
-        return invocation.transaction_hash
-
-
-    async def _read_abi(self, abi_path):
-        with open(abi_path, 'r') as file:
-            return orjson.loads(file.read())
+        self.receipts.wait(invocation.transaction_hash)
 
-
-    async def _load_existing_data(self):
-        if not os.path.exists(self.file_path):
-            return []
-
-        with open(self.file_path, 'rb') as file:
-            return orjson.loads(file.read())
-
-    async def _save_data(self, data):
-        with open(self.file_path, 'wb') as file:
-            file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return invocation.transaction_hash
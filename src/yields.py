@@ -0,0 +1,85 @@
+from typing import Optional
+import numpy as np
+
+SORT_COLUMNS = ("apy", "tvl")
+
+
+class YieldTable:
+    """
+    Columnar, read-only view of the staking feed for exact ranking queries.
+
+    Numeric columns are NumPy arrays; chain, token and stablecoin have
+    precomputed position indexes, so a filter is a few mask operations and
+    top-k is an argpartition instead of a scan over the rows.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.apy = np.array([float(row["apy"] or 0) for row in rows], dtype=np.float64)
+        self.tvl = np.array([float(row["tvl"] or 0) for row in rows], dtype=np.float64)
+        self.stablecoin = np.array([row.get("stablecoin") is True for row in rows], dtype=bool)
+
+        self._chain_index = self._index(str(row.get("chain", "")).lower() for row in rows)
+        self._token_index = self._index(str(row.get("nameToken", "")).lower() for row in rows)
+
+    @staticmethod
+    def _index(values):
+        index = {}
+        for position, value in enumerate(values):
+            index.setdefault(value, []).append(position)
+        return {value: np.array(positions, dtype=np.int64) for value, positions in index.items()}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def chains(self):
+        return sorted(self._chain_index)
+
+    def tokens(self):
+        return sorted(self._token_index)
+
+    def _select(self, index, value):
+        mask = np.zeros(len(self.rows), dtype=bool)
+        positions = index.get(value.lower())
+        if positions is not None:
+            mask[positions] = True
+        return mask
+
+    def query(
+        self,
+        chain: Optional[str] = None,
+        token: Optional[str] = None,
+        stablecoin: Optional[bool] = None,
+        min_apy: Optional[float] = None,
+        min_tvl: Optional[float] = None,
+        sort_by: str = "apy",
+        descending: bool = True,
+        limit: Optional[int] = 10
+    ):
+        """Rows matching every given filter, sorted by `sort_by` ("apy" or "tvl"), at most `limit`."""
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort_by}; expected one of {', '.join(SORT_COLUMNS)}")
+
+        mask = np.ones(len(self.rows), dtype=bool)
+        if chain:
+            mask &= self._select(self._chain_index, chain)
+        if token:
+            mask &= self._select(self._token_index, token)
+        if stablecoin is not None:
+            mask &= self.stablecoin == stablecoin
+        if min_apy is not None:
+            mask &= self.apy >= min_apy
+        if min_tvl is not None:
+            mask &= self.tvl >= min_tvl
+
+        positions = np.flatnonzero(mask)
+        keys = getattr(self, sort_by)[positions]
+        if descending:
+            keys = -keys
+
+        if limit is not None and limit < len(positions):
+            top = np.argpartition(keys, limit)[:limit] if limit > 0 else np.array([], dtype=np.int64)
+            order = top[np.argsort(keys[top], kind="stable")]
+        else:
+            order = np.argsort(keys, kind="stable")
+        return [self.rows[position] for position in positions[order]]
@@ -0,0 +1,110 @@
+import sys
+import os
+import re
+import hashlib
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.answers import AnswerCache, QueryFilters
+from src.yields import YieldTable
+
+ROWS = [
+    {"chain": "Base", "nameToken": "USDC", "apy": 5.0, "tvl": 1e6, "stablecoin": True},
+    {"chain": "Arbitrum", "nameToken": "DAI", "apy": 7.0, "tvl": 2e6, "stablecoin": True},
+    {"chain": "Base", "nameToken": "WETH", "apy": 3.0, "tvl": 5e6, "stablecoin": False}
+]
+STOPWORDS = {"what", "which", "is", "has", "the", "on", "a", "pool", "me", "give", "with"}
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Bag of words plus a large shared component, so unrelated wording barely
+    moves the similarity: like ada-002, near-duplicates score well above 0.9.
+    """
+
+    dim = 256
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim)
+        vector[0] = 6.0
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word not in STOPWORDS:
+                vector[1 + int(hashlib.sha256(word.encode()).hexdigest(), 16) % (self.dim - 1)] += 1.0
+        return vector.tolist()
+
+
+def similarity(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return float(a @ b / np.linalg.norm(a) / np.linalg.norm(b))
+
+
+class Harness:
+    def __init__(self):
+        table = YieldTable(ROWS)
+        self.filters = QueryFilters(table.chains(), table.tokens())
+        self.embeddings = FakeEmbeddings()
+        self.cache = AnswerCache()
+
+    def add(self, question, answer):
+        self.cache.add(1, self.embeddings.embed_query(question), question, answer, self.filters.extract(question))
+
+    def lookup(self, question):
+        cached = self.cache.lookup(1, self.embeddings.embed_query(question), self.filters.extract(question))
+        return cached[0] if cached else None
+
+
+QUESTION = "What is the highest APY pool on Base?"
+
+
+def test_paraphrase_hits():
+    harness = Harness()
+    harness.add(QUESTION, '{"id_project": "base-usdc"}')
+
+    assert harness.lookup("Which pool on base has the highest apy") == '{"id_project": "base-usdc"}'
+
+
+def test_different_chain_misses_despite_close_embedding():
+    harness = Harness()
+    harness.add(QUESTION, '{"id_project": "base-usdc"}')
+    other = "What is the highest APY pool on Arbitrum?"
+
+    # Close enough that the threshold alone would serve the Base answer
+    assert similarity(FakeEmbeddings().embed_query(QUESTION), FakeEmbeddings().embed_query(other)) > harness.cache.threshold
+    assert harness.lookup(other) is None
+
+
+def test_opposite_direction_misses():
+    harness = Harness()
+    harness.add(QUESTION, '{"id_project": "base-usdc"}')
+
+    assert harness.lookup("What is the lowest APY pool on Base?") is None
+
+
+def test_different_token_or_metric_misses():
+    harness = Harness()
+    harness.add("highest APY USDC pool on Base", '{"id_project": "base-usdc"}')
+
+    assert harness.lookup("highest APY DAI pool on Base") is None
+    assert harness.lookup("highest TVL USDC pool on Base") is None
+
+
+def test_matching_entry_wins_over_closer_mismatch():
+    harness = Harness()
+    harness.add("What is the highest APY pool on Arbitrum?", '{"id_project": "arbitrum-dai"}')
+    harness.add("highest apy on base please", '{"id_project": "base-usdc"}')
+
+    assert harness.lookup(QUESTION) == '{"id_project": "base-usdc"}'
+
+
+def test_extract_is_case_and_order_insensitive():
+    filters = QueryFilters(["base", "arbitrum"], ["usdc"])
+
+    assert filters.extract("Top stablecoin yield, USDC, on BASE") == filters.extract("on base: usdc stablecoin with top yield")
+    assert filters.extract("basement") == filters.extract("nothing")
@@ -0,0 +1,243 @@
+import sys
+import os
+import re
+import time
+import asyncio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from typing import List
+
+import orjson
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.batcher import MicroBatcher
+from src.risk import RiskBatch, SubmissionRisk, parse_batch
+
+USERS = [f"0x{i:040x}" for i in range(1, 7)]
+
+
+class FakeClassifierModel(BaseChatModel):
+    """
+    Classifies each questionnaire as the risk level written in it. Bound to
+    the RiskBatch tool it answers a whole batch, optionally reversed, with
+    some submissions left out, or failing; unbound it answers one
+    questionnaire the way the single-request agent expects.
+    """
+
+    reverse: bool = False
+    missing: List[int] = []
+    fail_batch: bool = False
+    fail_single: bool = False
+    structured: bool = False
+    batches: List[int] = []
+    singles: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "fake-classifier"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"structured": bool(tools)})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.structured:
+            message = self._classify_batch(messages[-1].content)
+        else:
+            text = messages[-1].content
+            self.singles.append(text)
+            if self.fail_single:
+                raise RuntimeError("model unavailable")
+            message = AIMessage(content=orjson.dumps({"risk": text.split()[-1]}).decode())
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _classify_batch(self, prompt):
+        submissions = re.findall(r"Submission (\d+):\n.* (\w+)$", prompt, re.MULTILINE)
+        self.batches.append(len(submissions))
+        if self.fail_batch:
+            raise RuntimeError("model unavailable")
+
+        risks = [
+            {"submission": int(number), "risk": risk}
+            for number, risk in submissions
+            if int(number) not in self.missing
+        ]
+        if self.reverse:
+            risks.reverse()
+        return AIMessage(content="", tool_calls=[{"name": "RiskBatch", "args": {"risks": risks}, "id": "call_1"}])
+
+
+async def submit_all(batcher, items):
+    return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+
+
+def test_flushes_when_batch_is_full():
+    sizes = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items, max_batch_size=4, max_wait=60)
+
+    started = time.monotonic()
+    results = asyncio.run(submit_all(batcher, ["a", "b", "c", "d"]))
+
+    assert results == ["a", "b", "c", "d"]
+    assert sizes == [4]
+    assert time.monotonic() - started < 5
+
+
+def test_flushes_when_max_wait_expires():
+    sizes = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items, max_batch_size=16, max_wait=0.1)
+
+    started = time.monotonic()
+    results = asyncio.run(submit_all(batcher, ["a", "b", "c"]))
+
+    assert results == ["a", "b", "c"]
+    assert sizes == [3]
+    assert time.monotonic() - started >= 0.1
+
+
+def test_splits_into_batches_and_fans_results_out():
+    sizes = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or [item.upper() for item in items],
+                           max_batch_size=2, max_wait=0.01)
+
+    results = asyncio.run(submit_all(batcher, ["a", "b", "c", "d", "e"]))
+
+    assert results == ["A", "B", "C", "D", "E"]
+    assert sizes == [2, 2, 1]
+    assert batcher.stats()["mean_batch_size"] == pytest.approx(5 / 3)
+
+
+def test_failure_only_reaches_its_own_batch():
+    def handler(items):
+        if "boom" in items:
+            raise RuntimeError("bad batch")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(handler, max_batch_size=2, max_wait=60)
+
+    results = asyncio.run(submit_all(batcher, ["a", "b", "boom", "c"]))
+
+    assert results[:2] == ["A", "B"]
+    assert all(isinstance(result, RuntimeError) for result in results[2:])
+    assert batcher.stats()["failed_batches"] == 1
+
+
+def test_wrong_result_count_fails_the_batch():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=2, max_wait=60)
+
+    results = asyncio.run(submit_all(batcher, ["a", "b"]))
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_parse_batch_matches_by_submission_number():
+    batch = RiskBatch(risks=[SubmissionRisk(submission=3, risk="high"), SubmissionRisk(submission=1, risk="low")])
+    assert parse_batch(batch, 3) == ["low", None, "high"]
+
+
+def test_parse_batch_drops_invalid_entries():
+    batch = RiskBatch(risks=[
+        SubmissionRisk(submission=1, risk="extreme"),
+        SubmissionRisk(submission=9, risk="low"),
+        SubmissionRisk(submission=2, risk="medium")
+    ])
+    assert parse_batch(batch, 2) == [None, "medium"]
+    assert parse_batch(None, 2) == [None, None]
+
+
+@pytest.fixture
+def make_classifier(tmp_path, monkeypatch):
+    agent = pytest.importorskip("src.agent")
+    monkeypatch.setenv("WALLET_STORE", "sqlite")
+    monkeypatch.setenv("WALLET_DB_PATH", str(tmp_path / "wallet.db"))
+    monkeypatch.setenv("CLASSIFIER_LOCAL_THRESHOLD", "1")
+    monkeypatch.delenv("CLASSIFIER_CACHE_PATH", raising=False)
+    monkeypatch.setenv("CLASSIFIER_MEMORY", "stateless")
+
+    def make(llm, batch_size, batch_wait=60):
+        return agent.CdpAgentClassifier(llm=llm, batch_size=batch_size, batch_wait=batch_wait)
+    return make
+
+
+def classify(classifier, answers):
+    async def run():
+        await classifier.initialize()
+        return await asyncio.gather(
+            *(classifier.process_query(f"Answers of user {index}: {risk}", user)
+              for index, (user, risk) in enumerate(zip(USERS, answers))),
+            return_exceptions=True
+        )
+    return asyncio.run(run())
+
+
+def risks_of(results):
+    return [orjson.loads(result)["risk"] if isinstance(result, str) else result for result in results]
+
+
+def test_classifier_batches_a_full_batch(make_classifier):
+    llm = FakeClassifierModel()
+    classifier = make_classifier(llm, batch_size=3)
+    answers = ["low", "high", "medium"]
+
+    results = classify(classifier, answers)
+
+    assert risks_of(results) == answers
+    assert all(orjson.loads(result)["source"] == "llm" for result in results)
+    assert llm.batches == [3]
+    assert llm.singles == []
+    assert [classifier.store.get_risk_profile(user) for user in USERS[:3]] == answers
+
+
+def test_classifier_flushes_after_batch_wait(make_classifier):
+    llm = FakeClassifierModel()
+    classifier = make_classifier(llm, batch_size=16, batch_wait=0.05)
+
+    results = classify(classifier, ["medium", "low"])
+
+    assert risks_of(results) == ["medium", "low"]
+    assert llm.batches == [2]
+
+
+def test_classifier_maps_out_of_order_reply_to_users(make_classifier):
+    llm = FakeClassifierModel(reverse=True)
+    classifier = make_classifier(llm, batch_size=4)
+    answers = ["low", "medium", "high", "high"]
+
+    results = classify(classifier, answers)
+
+    assert risks_of(results) == answers
+    assert [classifier.store.get_risk_profile(user) for user in USERS[:4]] == answers
+
+
+def test_classifier_retries_missing_items_alone(make_classifier):
+    llm = FakeClassifierModel(missing=[2])
+    classifier = make_classifier(llm, batch_size=3)
+
+    results = classify(classifier, ["low", "medium", "high"])
+
+    assert risks_of(results) == ["low", "medium", "high"]
+    assert llm.batches == [3]
+    assert llm.singles == ["Answers of user 1: medium"]
+
+
+def test_classifier_falls_back_when_the_batch_call_fails(make_classifier):
+    llm = FakeClassifierModel(fail_batch=True)
+    classifier = make_classifier(llm, batch_size=2)
+
+    results = classify(classifier, ["high", "low"])
+
+    assert risks_of(results) == ["high", "low"]
+    assert sorted(llm.singles) == ["Answers of user 0: high", "Answers of user 1: low"]
+    assert classifier.stats()["batches"]["failed_batches"] == 1
+
+
+def test_classifier_errors_reach_each_caller(make_classifier):
+    llm = FakeClassifierModel(fail_batch=True, fail_single=True)
+    classifier = make_classifier(llm, batch_size=2)
+
+    results = classify(classifier, ["high", "low"])
+
+    assert all(isinstance(result, Exception) for result in results)
+    assert classifier.store.get_risk_profile(USERS[0]) is None
@@ -0,0 +1,47 @@
+import sys
+import os
+import time
+import multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from lease import WalletLease
+
+
+def hold_lease(lock_dir, user_address, events):
+    with WalletLease(lock_dir).hold(user_address):
+        events.put(("in", user_address, time.monotonic()))
+        time.sleep(0.2)
+        events.put(("out", user_address, time.monotonic()))
+
+
+def run_processes(lock_dir, user_addresses):
+    events = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=hold_lease, args=(lock_dir, user_address, events))
+        for user_address in user_addresses
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [event[:2] for event in sorted((events.get() for _ in range(2 * len(processes))), key=lambda e: e[2])]
+
+
+def test_same_wallet_takes_turns_across_processes(tmp_path):
+    order = run_processes(str(tmp_path), ["0xAbC", "0xabc"])
+
+    assert [kind for kind, _ in order] == ["in", "out", "in", "out"]
+
+
+def test_different_wallets_run_together(tmp_path):
+    order = run_processes(str(tmp_path), ["0x01", "0x02"])
+
+    assert [kind for kind, _ in order][:2] == ["in", "in"]
+
+
+def test_run_returns_result_and_releases(tmp_path):
+    lease = WalletLease(str(tmp_path))
+
+    assert lease.run("0x01", lambda a, b: a + b, 1, b=2) == 3
+    with lease.hold("0x01"):
+        pass
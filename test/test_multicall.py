@@ -0,0 +1,181 @@
+import sys
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import numpy as np
+import pytest
+from eth_abi import decode, encode
+from eth_utils import to_checksum_address
+from web3 import Web3
+
+from abi import abi_registry
+from multicall import MULTICALL3_ADDRESS, BatchBalanceReader
+
+USERS = [to_checksum_address(f"0x{i:040x}") for i in range(1, 6)]
+PROTOCOLS = [to_checksum_address(f"0x{0xa0 + i:040x}") for i in range(3)]
+BALANCE_OF = abi_registry.function("MockStake", "getAmountStakeByUser")
+AGGREGATE3 = abi_registry.function("Multicall3", "aggregate3")
+
+
+def raw_balance(user, protocol):
+    return (int(user, 16) * 10 + int(protocol, 16) - 0xa0) * 10 ** 6
+
+
+class FakeNode:
+    """JSON-RPC endpoint answering eth_call for Multicall3 and MockStake balances."""
+
+    def __init__(self):
+        self.reverting = set()
+        self.failing_users = set()
+        self.requests = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                node.requests.append(body)
+                try:
+                    if isinstance(body, list):
+                        response = [node.handle(item) for item in body]
+                    else:
+                        response = node.handle(body)
+                except ConnectionError:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                payload = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def calls(self):
+        """HTTP requests carrying eth_calls (web3 also sends its own eth_chainId)."""
+        return [
+            body for body in self.requests
+            if any(item["method"] == "eth_call" for item in (body if isinstance(body, list) else [body]))
+        ]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def balance_of(self, target, data):
+        """(success, return data) of getAmountStakeByUser on `target`."""
+        (user,) = decode(["address"], data[4:])
+        user = to_checksum_address(user)
+        if user in self.failing_users:
+            raise ConnectionError(user)
+        if to_checksum_address(target) in self.reverting:
+            return False, b""
+        return True, encode(["uint256"], [raw_balance(user, to_checksum_address(target))])
+
+    def handle(self, request):
+        if request["method"] != "eth_call":
+            return {"jsonrpc": "2.0", "id": request["id"], "result": "0x1"}
+
+        call = request["params"][0]
+        data = bytes.fromhex(call["data"][2:])
+        if to_checksum_address(call["to"]) == MULTICALL3_ADDRESS:
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            returned = [self.balance_of(target, calldata) for target, _, calldata in calls]
+            result = encode(["(bool,bytes)[]"], [returned])
+        else:
+            success, result = self.balance_of(call["to"], data)
+            if not success:
+                return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": 3, "message": "execution reverted"}}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": "0x" + result.hex()}
+
+
+@pytest.fixture
+def node():
+    node = FakeNode()
+    yield node
+    node.close()
+
+
+def make_reader(node, **kwargs):
+    w3 = Web3(Web3.HTTPProvider(node.url, exception_retry_configuration=None))
+    return BatchBalanceReader(w3, node.url, **kwargs)
+
+
+def expected(users=USERS, protocols=PROTOCOLS):
+    return np.array([[raw_balance(user, protocol) / 10 ** 6 for protocol in protocols] for user in users])
+
+
+def test_codecs_round_trip():
+    calldata = AGGREGATE3.encode([(PROTOCOLS[0], True, BALANCE_OF.encode(USERS[0]))])
+    assert calldata[:4] == AGGREGATE3.selector
+    assert BALANCE_OF.decode(encode(["uint256"], [123]))[0] == 123
+
+
+@pytest.mark.parametrize("mode", ["multicall", "batch"])
+def test_reads_every_pair(node, mode):
+    balances = make_reader(node, mode=mode).read(USERS, PROTOCOLS)
+
+    assert balances.shape == (len(USERS), len(PROTOCOLS))
+    np.testing.assert_array_equal(balances, expected())
+    assert len(node.calls) == 1
+
+
+@pytest.mark.parametrize("mode", ["multicall", "batch"])
+def test_chunks_calls(node, mode):
+    balances = make_reader(node, mode=mode, chunk_size=4).read(USERS, PROTOCOLS)
+
+    np.testing.assert_array_equal(balances, expected())
+    # 15 calls in chunks of 4
+    assert len(node.calls) == 4
+
+
+def test_lowercase_addresses_are_accepted(node):
+    balances = make_reader(node).read([user.lower() for user in USERS], [p.lower() for p in PROTOCOLS])
+    np.testing.assert_array_equal(balances, expected())
+
+
+@pytest.mark.parametrize("mode", ["multicall", "batch"])
+def test_failed_call_is_nan(node, mode):
+    node.reverting.add(PROTOCOLS[1])
+
+    balances = make_reader(node, mode=mode).read(USERS, PROTOCOLS)
+
+    assert np.isnan(balances[:, 1]).all()
+    np.testing.assert_array_equal(balances[:, [0, 2]], expected()[:, [0, 2]])
+
+
+@pytest.mark.parametrize("mode", ["multicall", "batch"])
+def test_failed_chunk_leaves_its_block_nan(node, mode):
+    # One chunk per user; the request carrying USERS[2] gets an HTTP 500
+    node.failing_users.add(USERS[2])
+
+    balances = make_reader(node, mode=mode, chunk_size=len(PROTOCOLS)).read(USERS, PROTOCOLS)
+
+    assert np.isnan(balances[2]).all()
+    others = [0, 1, 3, 4]
+    np.testing.assert_array_equal(balances[others], expected()[others])
+    assert len(node.calls) == len(USERS)
+
+
+def test_unreachable_endpoint_is_all_nan():
+    url = "http://127.0.0.1:9"
+    w3 = Web3(Web3.HTTPProvider(url, exception_retry_configuration=None))
+    balances = BatchBalanceReader(w3, url, mode="batch").read(USERS[:2], PROTOCOLS)
+
+    assert balances.shape == (2, len(PROTOCOLS))
+    assert np.isnan(balances).all()
+
+
+def test_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        BatchBalanceReader(None, "http://127.0.0.1:9", mode="graphql")